@@ -0,0 +1,182 @@
+"""Incremental, deduplicated backups of a server directory.
+
+Files are stored compressed under the hash of their content, so a file
+which didn't change since the previous snapshot isn't stored again.
+Each snapshot is a manifest mapping paths to content hashes."""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import time
+import zlib
+
+
+def store_file(path, objects):
+    """Hash a file and store it compressed if its content is new.
+
+    Runs in a worker process. Returns the hash and the number of bytes written."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha.update(data)
+    digest = sha.hexdigest()
+    target = os.path.join(objects, digest[:2], digest)
+    if os.path.exists(target):
+        return digest, 0
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    compressed = zlib.compress(data, 6)
+    temp = '{target}.{pid}.tmp'.format(target=target, pid=os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(compressed)
+    os.replace(temp, target)
+    return digest, len(compressed)
+
+
+class Store:
+    """Snapshots and objects on disk. Methods of this class block, run them in an executor."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.objects = os.path.join(directory, 'objects')
+        self.snapshots = os.path.join(directory, 'snapshots')
+
+    def list(self):
+        """Names of the snapshots, oldest first."""
+        try:
+            return sorted(name[:-5] for name in os.listdir(self.snapshots) if name.endswith('.json'))
+        except FileNotFoundError:
+            return []
+
+    def load(self, name):
+        with open(os.path.join(self.snapshots, name + '.json')) as f:
+            return json.load(f)
+
+    def save(self, name, manifest):
+        os.makedirs(self.snapshots, exist_ok=True)
+        temp = os.path.join(self.snapshots, name + '.tmp')
+        with open(temp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp, os.path.join(self.snapshots, name + '.json'))
+
+    def prune(self, keep):
+        """Remove old snapshots and the objects no other snapshot references."""
+        names = self.list()
+        if len(names) <= keep:
+            return 0
+        for name in names[:-keep]:
+            os.remove(os.path.join(self.snapshots, name + '.json'))
+        used = set()
+        for name in names[-keep:]:
+            used.update(entry[0] for entry in self.load(name).values())
+        removed = 0
+        if not os.path.isdir(self.objects):
+            return removed
+        for prefix in os.listdir(self.objects):
+            for digest in os.listdir(os.path.join(self.objects, prefix)):
+                if digest not in used:
+                    os.remove(os.path.join(self.objects, prefix, digest))
+                    removed += 1
+        return removed
+
+    def restore(self, name, target):
+        """Extract a snapshot into a directory."""
+        for path, (digest, size, mtime) in self.load(name).items():
+            destination = os.path.join(target, path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open(os.path.join(self.objects, digest[:2], digest), 'rb') as f:
+                data = zlib.decompress(f.read())
+            with open(destination, 'wb') as f:
+                f.write(data)
+            os.utime(destination, ns=(mtime, mtime))
+
+
+def scan(root, excluded):
+    """List files under root as {path: (size, mtime)}, skipping excluded directories."""
+    files = {}
+    excluded = set(os.path.abspath(path) for path in excluded)
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(directory, d)) not in excluded]
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files[os.path.relpath(path, root)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class Backup:
+    """Back up the directory of an instance without stopping it.
+
+    World saving is turned off while the snapshot is taken. Files whose
+    size and modification time didn't change reuse their previous hash,
+    the others are hashed and compressed in a process pool."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.cfg = instance.cfg
+        self.root = instance.cfg['mc-directory']
+        self.store = Store(os.path.join(self.root, self.cfg['backup-directory']))
+        self.pool: concurrent.futures.ProcessPoolExecutor = None
+        self.running = False
+        self.saved = asyncio.Event()
+        instance.classifier.register(self.on_saved, 'Saved the ')
+
+    async def on_saved(self, line, match):
+        self.saved.set()
+
+    async def flush(self):
+        """Make the server write everything to disk."""
+        if self.instance.cfg['rcon-port']:
+            await self.instance.transport.command('save-all flush')
+            return
+        self.saved.clear()
+        self.instance.console('save-all flush')
+        await asyncio.wait_for(self.saved.wait(), 120)
+
+    async def run(self):
+        """Take a snapshot, return statistics about it."""
+        loop = self.instance.client.loop
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.cfg['backup-workers'])
+        names = await loop.run_in_executor(None, self.store.list)
+        previous = await loop.run_in_executor(None, self.store.load, names[-1]) if names else {}
+        excluded = [self.store.directory, os.path.join(self.root, self.cfg['log-directory'])]
+        online = self.instance.running
+        start = time.monotonic()
+        if online:
+            self.instance.console('save-off')
+            await self.flush()
+        try:
+            files = await loop.run_in_executor(None, scan, self.root, excluded)
+            manifest = {}
+            changed = []
+            for path, (size, mtime) in files.items():
+                entry = previous.get(path)
+                if entry is not None and entry[1] == size and entry[2] == mtime:
+                    manifest[path] = entry
+                else:
+                    changed.append(path)
+            results = await asyncio.gather(*[
+                loop.run_in_executor(self.pool, store_file, os.path.join(self.root, path), self.store.objects)
+                for path in changed], return_exceptions=True)
+        finally:
+            if online:
+                self.instance.console('save-on')
+        paused = time.monotonic() - start
+        written = 0
+        for path, result in zip(changed, results):
+            if isinstance(result, OSError):  # File removed or unreadable, skip it
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            digest, size = result
+            written += size
+            manifest[path] = [digest, files[path][0], files[path][1]]
+        name = time.strftime('%Y%m%d-%H%M%S')
+        await loop.run_in_executor(None, self.store.save, name, manifest)
+        removed = await loop.run_in_executor(None, self.store.prune, self.cfg['backup-keep'])
+        return {'name': name, 'files': len(manifest), 'changed': len(changed), 'written': written,
+                'paused': paused, 'removed': removed}
@@ -0,0 +1,136 @@
+"""In-process stand-in for the Discord API, used by the benchmarks.
+
+`FakeDiscord` replaces the discord.Client methods minecord calls, without
+any network access. Every request waits for a simulated latency, and
+some of them get rate limited, waiting `retry_after` like discord.py
+does after a 429 response. Callbacks in `watchers` are called with each
+message once it is sent or edited."""
+import asyncio
+import itertools
+import random
+import time
+import discord
+
+
+class NotFoundResponse:
+    status = 404
+    reason = 'Not Found'
+
+
+class Server:
+    def __init__(self, me):
+        self.me = me
+
+
+class Channel:
+    def __init__(self, channel_id, me):
+        self.id = channel_id
+        self.server = Server(me)
+
+
+class Member:
+    def __init__(self, uid, name):
+        self.id = uid
+        self.name = name
+        self.nick = None
+        self.mention = '<@{id}>'.format(id=uid)
+
+
+class Reaction:
+    def __init__(self, message, emoji, me):
+        self.message = message
+        self.emoji = emoji
+        self.me = me
+
+
+class Message:
+    def __init__(self, message_id, channel, author, content):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.clean_content = content
+        self.reactions = []
+
+
+class FakeDiscord(discord.Client):
+    """discord.Client with the requests made by minecord answered locally.
+
+    Place it after minecord.Client in the bases of a class, so that
+    minecord's rate-limited wrappers call it instead of discord.py."""
+
+    def __init__(self, *args, latency=0.05, jitter=0.02, rate_limited=0.01, retry_after=1, **kwargs):
+        super(FakeDiscord, self).__init__(*args, **kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.ids = itertools.count(10 ** 18)
+        self.me = Member(str(next(self.ids)), 'minecord')
+        self.channels = {}
+        self.messages = {}
+        self.requests = []  # (route, duration)
+        self.watchers = []
+
+    @property
+    def user(self):
+        return self.me
+
+    def get_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = Channel(channel_id, self.me)
+        return channel
+
+    def message(self, channel_id, author, content):
+        """Build a message as if a user posted it."""
+        return Message(str(next(self.ids)), self.get_channel(channel_id), author, content)
+
+    async def request(self, route):
+        start = time.perf_counter()
+        await asyncio.sleep(max(0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.rate_limited:
+            await asyncio.sleep(self.retry_after)
+        self.requests.append((route, time.perf_counter() - start))
+
+    def posted(self, message):
+        for watcher in self.watchers:
+            watcher(message)
+
+    async def send_message(self, destination, content=None, *args, **kwargs):
+        await self.request('send')
+        message = Message(str(next(self.ids)), destination, self.me, content)
+        self.messages[message.id] = message
+        self.posted(message)
+        return message
+
+    async def edit_message(self, message, new_content=None, *args, **kwargs):
+        await self.request('edit')
+        message.content = new_content
+        self.posted(message)
+        return message
+
+    async def delete_message(self, message):
+        await self.request('delete')
+        self.messages.pop(message.id, None)
+
+    async def get_message(self, channel, id):
+        await self.request('get')
+        message = self.messages.get(id)
+        if message is None:
+            raise discord.NotFound(NotFoundResponse(), 'Unknown Message')
+        return message
+
+    async def add_reaction(self, message, emoji):
+        await self.request('react')
+        message.reactions.append(Reaction(message, emoji, True))
+
+    async def remove_reaction(self, message, emoji, member):
+        await self.request('react')
+        message.reactions = [r for r in message.reactions if not (r.emoji == emoji and r.me == (member is self.me))]
+
+    async def pin_message(self, message):
+        await self.request('pin')
+
+    async def unpin_message(self, message):
+        await self.request('pin')
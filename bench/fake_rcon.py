@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""A fake Minecraft RCON server, to test and benchmark rcon.py.
+
+It answers packets in order like the server does: a login, commands, and
+"Unknown request" for packets of any other type. Responses longer than
+4096 bytes are split into several packets. A few commands help testing:
+
+- `echo <text>`: answers the text.
+- `big <size>`: answers `size` bytes.
+- `sleep <seconds>`: answers after a delay, holding the next packets.
+- `drop`: closes the connection without answering."""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rcon import COMMAND, LOGIN, MAX_PAYLOAD, read_packet  # noqa: E402
+
+
+def pack(request_id, kind, body: bytes):
+    payload = struct.pack('<ii', request_id, kind) + body + b'\x00\x00'
+    return struct.pack('<i', len(payload)) + payload
+
+
+class FakeRcon:
+    def __init__(self, password='secret'):
+        self.password = password
+        self.server: asyncio.AbstractServer = None
+        self.connections = 0
+        self.commands = []
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.accept, host, port)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def answer(self, command):
+        name, _, args = command.partition(' ')
+        if name == 'echo':
+            return args.encode()
+        if name == 'big':
+            return b'x' * int(args)
+        if name == 'sleep':
+            await asyncio.sleep(float(args))
+            return b'Slept'
+        if name == 'drop':
+            return None
+        return 'Unknown command: {name}'.format(name=name).encode()
+
+    async def accept(self, reader, writer):
+        self.connections += 1
+        authenticated = False
+        try:
+            while True:
+                request_id, kind, body = await read_packet(reader)
+                if kind == LOGIN:
+                    authenticated = body.decode() == self.password
+                    writer.write(pack(request_id if authenticated else -1, COMMAND, b''))
+                elif not authenticated:
+                    break
+                elif kind == COMMAND:
+                    self.commands.append(body.decode())
+                    response = await self.answer(body.decode())
+                    if response is None:
+                        break
+                    for start in range(0, max(1, len(response)), MAX_PAYLOAD):
+                        writer.write(pack(request_id, 0, response[start:start + MAX_PAYLOAD]))
+                else:
+                    writer.write(pack(request_id, 0, 'Unknown request {kind:x}'.format(kind=kind).encode()))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulate the RCON server of Minecraft.')
+    parser.add_argument('--port', type=int, default=25575, help='Port to listen on')
+    parser.add_argument('--password', default='secret', help='RCON password')
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(FakeRcon(args.password).start(port=args.port))
+    loop.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""A fake Minecraft server, to be used as `mc-command` in benchmarks.
+
+It prints console lines at a given rate, mixing chat, player and noise
+lines like a busy server, and answers a few commands read from stdin.
+Chat lines carry the time they were written, so the benchmark can measure
+how long they take to go through minecord."""
+import argparse
+import itertools
+import random
+import sys
+import threading
+import time
+
+PLAYERS = ['Steve', 'Alex', 'Notch', 'jeb_', 'Dinnerbone', 'Grumm', 'Herobrine', 'Kubo']
+NOISE = [
+    ('Server thread/WARN', "Can't keep up! Is the server overloaded? Running 2041ms or 40 ticks behind"),
+    ('Server thread/INFO', 'Saving chunks for level \'ServerLevel[world]\'/minecraft:overworld'),
+    ('Server thread/INFO', 'ThreadedAnvilChunkStorage (world): All chunks are saved'),
+    ('Worker-Main-3/WARN', 'Skipping bad entity at 120.5, 64.0, -32.1'),
+    ('Server thread/INFO', '{player} has made the advancement [Stone Age]'),
+    ('Server thread/INFO', '{player} was slain by Zombie'),
+]
+
+lock = threading.Lock()
+
+
+def log(logger, text):
+    line = '[{time}] [{logger}]: {text}\n'.format(time=time.strftime('%H:%M:%S'), logger=logger, text=text)
+    with lock:
+        sys.stdout.write(line)
+
+
+def flush():
+    with lock:
+        sys.stdout.flush()
+
+
+def answer(command, online):
+    """Answer a command like the server would."""
+    name, _, args = command.partition(' ')
+    if name == 'list':
+        log('Server thread/INFO', 'There are {count} of a max of 20 players online: {players}'.format(
+            count=len(online), players=', '.join(sorted(online))))
+    elif name.startswith('save-all'):
+        log('Server thread/INFO', 'Saving the game (this may take a moment!)')
+        log('Server thread/INFO', 'Saved the game')
+    elif name in ('save-on', 'save-off'):
+        log('Server thread/INFO', 'Automatic saving is now {state}'.format(
+            state='enabled' if name == 'save-on' else 'disabled'))
+    elif name == 'say':
+        log('Server thread/INFO', '[Server] ' + args)
+    elif name == 'give':
+        player, item, *count = args.split()
+        log('Server thread/INFO', 'Gave {count} [{item}] to {player}'.format(
+            count=count[0] if count else 1, item=item.title(), player=player))
+    elif name == 'tp':
+        player, *position = args.split()
+        log('Server thread/INFO', 'Teleported {player} to {position}'.format(player=player, position=', '.join(position)))
+    elif name == 'gamerule':
+        rule, value = args.split()
+        log('Server thread/INFO', 'Gamerule {rule} is now set to: {value}'.format(rule=rule, value=value))
+    elif name == 'tellraw':
+        pass  # Not logged by the server
+    elif name == 'stop':
+        log('Server thread/INFO', 'Stopping server')
+        flush()
+        return False
+    else:
+        log('Server thread/INFO', 'Unknown or incomplete command, see below for error')
+    flush()
+    return True
+
+
+def read_commands(online, done):
+    for command in sys.stdin:
+        if not answer(command.strip(), online):
+            break
+    done.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulate the console of a Minecraft server.')
+    parser.add_argument('--rate', type=float, default=100, help='Console lines per second')
+    parser.add_argument('--chat', type=float, default=0.3, help='Fraction of lines which are chat messages')
+    parser.add_argument('--players', type=int, default=8, help='Number of players joining the server')
+    parser.add_argument('--startup', type=float, default=1, help='Startup time, in seconds')
+    parser.add_argument('--duration', type=float, default=0, help='Exit after this many seconds, 0 to run until stopped')
+    args = parser.parse_args()
+
+    online = set()
+    done = threading.Event()
+    threading.Thread(target=read_commands, args=(online, done), daemon=True).start()
+    log('Server thread/INFO', 'Starting minecraft server version 1.20.1')
+    log('Server thread/INFO', 'Preparing level "world"')
+    flush()
+    time.sleep(args.startup)
+    log('Server thread/INFO', 'Done ({time:.3f}s)! For help, type "help"'.format(time=args.startup))
+    flush()
+
+    players = (PLAYERS * (args.players // len(PLAYERS) + 1))[:args.players]
+    players = [name if i < len(PLAYERS) else '{name}{i}'.format(name=name[:12], i=i) for i, name in enumerate(players)]
+    start = time.monotonic()
+    batch = max(1, int(args.rate / 100))  # Write in small batches, like a server flushing its log
+    for count in itertools.count(0, batch):
+        if done.is_set() or args.duration and time.monotonic() - start > args.duration:
+            break
+        for _ in range(batch):
+            player = random.choice(players)
+            if player not in online:
+                online.add(player)
+                log('Server thread/INFO', '{player} joined the game'.format(player=player))
+            elif random.random() < 0.01:
+                online.discard(player)
+                log('Server thread/INFO', '{player} left the game'.format(player=player))
+            elif random.random() < args.chat:
+                log('Server thread/INFO', '<{player}> bench {time:.6f}'.format(player=player, time=time.time()))
+            else:
+                logger, text = random.choice(NOISE)
+                log(logger, text.format(player=player))
+        flush()
+        delay = start + (count + batch) / args.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    log('Server thread/INFO', 'Stopping server')
+    flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""Measure the throughput and latency of minecord, without Minecraft or Discord.
+
+minecord runs in-process against a stand-in for Discord (fake_discord.py),
+and starts fake_server.py as its Minecraft server. Scenarios:
+
+- console: the server writes lines as fast as asked, with chat lines
+  carrying the time they were written; reports the lines/sec read, the
+  delay before chat lines are dispatched, and before they are posted.
+- commands: users post commands, forwarded to the server with their
+  responses posted back; reports commands/sec and the delay before the
+  reply is posted.
+
+Memory is measured in a separate pass, as tracing allocations slows down
+the timed scenarios. Use `python bench/run.py --help` for options, and
+`--json` to keep results for comparison with a later run."""
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, ROOT)
+
+import control  # noqa: E402
+import fake_discord  # noqa: E402
+import metrics  # noqa: E402
+import minecord  # noqa: E402
+
+CHANNEL = '100000000000000000'
+USER = '200000000000000000'
+# Chat lines of the fake server as posted by minecord
+POSTED_CHAT = re.compile(r'^\*\*[^*]*\*\*: bench ([0-9.]+)$', re.MULTILINE)
+
+
+class BenchClient(minecord.Client, fake_discord.FakeDiscord):
+    """minecord's client, talking to the stand-in for Discord."""
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def make_config(directory, args):
+    with open(os.path.join(ROOT, 'config.json')) as f:
+        config = json.load(f)
+    config.pop('servers', None)
+    roles, users = os.path.join(directory, 'roles.json'), os.path.join(directory, 'users.json')
+    with open(roles, 'w') as f:
+        json.dump({'admin': ['@']}, f)
+    with open(users, 'w') as f:
+        json.dump({USER: 'admin'}, f)
+    command = [sys.executable, os.path.join(BENCH, 'fake_server.py'), '--rate', str(args.rate),
+               '--players', str(args.players), '--startup', '0.5']
+    config.update({'mc-command': ' '.join(command), 'mc-directory': directory, 'mc-autostart': False,
+                   'channel': CHANNEL, 'prefixes': ['!mc'], 'role-config': roles, 'role-users': users,
+                   'metrics': True, 'metrics-file': '', 'metrics-port': 0, 'rcon-port': 0, 'schedule': [],
+                   'watchdog-interval': 0})
+    return config
+
+
+async def wait_ready(server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while server.state != 'ready':
+        if time.monotonic() > deadline:
+            raise RuntimeError('The fake server did not start')
+        await asyncio.sleep(0.05)
+
+
+async def console_scenario(client, server, args):
+    dispatched, posted, seen = [], [], set()
+
+    async def on_bench_chat(line, match):
+        dispatched.append(time.time() - float(match.group(1)))
+
+    def on_posted(message):
+        now = time.time()
+        for written in POSTED_CHAT.findall(message.content or ''):
+            if written not in seen:  # Edits repeat the lines already posted
+                seen.add(written)
+                posted.append(now - float(written))
+    server.classifier.register(on_bench_chat, '<', r'<[^\s<>]*> bench ([0-9.]+)$')
+    client.watchers.append(on_posted)
+    server.chat = True
+    key = ('console_lines_total', metrics.labels(server=CHANNEL))
+    before, dropped, start = client.metrics.counters[key], server.chat_buffer.dropped, time.monotonic()
+    await asyncio.sleep(args.duration)
+    lines = client.metrics.counters[key] - before
+    dropped = server.chat_buffer.dropped - dropped
+    elapsed = time.monotonic() - start
+    server.classifier.unregister(on_bench_chat)
+    client.watchers.remove(on_posted)
+    server.chat = False
+    return {'lines': lines, 'lines_per_sec': lines / elapsed, 'chat_lines': len(dispatched),
+            'dispatch_p50_ms': percentile(dispatched, 50) * 1000, 'dispatch_p99_ms': percentile(dispatched, 99) * 1000,
+            'chat_posted': len(posted), 'chat_dropped': dropped, 'chat_p50_ms': percentile(posted, 50) * 1000,
+            'chat_p99_ms': percentile(posted, 99) * 1000}
+
+
+class Replies:
+    """Tell when the reply to a posted command is sent to Discord.
+
+    Commands sent while a console capture is open join it, and their output
+    is posted with the reply of the request which opened the capture, from
+    the task of that request."""
+
+    def __init__(self, client, transport):
+        self.client = client
+        self.transport = transport
+        self.leader = None
+        self.waiting = {}  # Task of a request opening a capture: futures of the commands it answers
+        self.posts = {}  # Task of a posted command: its future
+
+    def __enter__(self):
+        self.request = self.transport.request
+        self.transport.request = self.wrap
+        self.client.watchers.append(self.on_posted)
+        return self
+
+    def __exit__(self, *exc):
+        del self.transport.request
+        self.client.watchers.remove(self.on_posted)
+
+    def expect(self):
+        future = self.posts[control.current_task()] = self.client.loop.create_future()
+        return future
+
+    async def wrap(self, *messages):
+        task = control.current_task()
+        if None not in self.transport.captures:  # This request opens a capture
+            self.leader = task
+        self.waiting.setdefault(self.leader, []).append(self.posts.pop(task))
+        return await self.request(*messages)
+
+    def on_posted(self, message):
+        now = time.perf_counter()
+        for future in self.waiting.pop(control.current_task(), ()):
+            if not future.done():
+                future.set_result(now)
+
+
+async def commands_scenario(client, server, args):
+    user = fake_discord.Member(USER, 'bench')
+    latencies = []
+    missing = 0
+
+    async def post(i):
+        nonlocal missing
+        content = '!mc list' if i % 2 else '!mc give Steve stone {i}; tp Steve 0 64 0; gamerule doDaylightCycle false'
+        replied = replies.expect()
+        start = time.perf_counter()
+        await client.on_message(client.message(CHANNEL, user, content.format(i=i)))
+        try:
+            latencies.append(await asyncio.wait_for(replied, 30) - start)
+        except asyncio.TimeoutError:
+            missing += 1
+
+    start = time.monotonic()
+    with Replies(client, server.transport) as replies:
+        for first in range(0, args.commands, args.concurrency):
+            await asyncio.gather(*[post(i) for i in range(first, min(args.commands, first + args.concurrency))])
+    elapsed = time.monotonic() - start
+    return {'commands': len(latencies), 'commands_per_sec': len(latencies) / elapsed, 'no_reply': missing,
+            'p50_ms': percentile(latencies, 50) * 1000, 'p99_ms': percentile(latencies, 99) * 1000}
+
+
+async def run(client, args):
+    await client.on_ready()
+    server = client.servers[CHANNEL]
+    await server.start_server()
+    await wait_ready(server)
+    results = {}
+    for name in args.scenarios:
+        client.requests.clear()
+        results[name] = await SCENARIOS[name](client, server, args)
+        results[name]['discord_requests'] = len(client.requests)
+        results[name]['discord_p99_ms'] = percentile([duration for route, duration in client.requests], 99) * 1000
+    await server.stop_server()
+    buffers = (server.chat_buffer, server.archive_buffer, server.players.pending)
+    while any(buffer.task is not None for buffer in buffers):
+        await asyncio.sleep(0.1)  # Let buffered lines be flushed
+    client.scheduler.heap.clear()  # Stop the timers, another client may run on the same loop
+    client.scheduler.arm()
+    return results
+
+
+def measure(args):
+    with tempfile.TemporaryDirectory() as directory:
+        client = BenchClient(make_config(directory, args))
+        client.latency, client.rate_limited = args.latency, args.rate_limited
+        return client.loop.run_until_complete(run(client, args))
+
+
+SCENARIOS = {'console': console_scenario, 'commands': commands_scenario}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark minecord with a fake server and a fake Discord.')
+    parser.add_argument('scenarios', nargs='*', help='Scenarios to run: {names}, all by default'.format(
+        names=', '.join(sorted(SCENARIOS))))
+    parser.add_argument('--rate', type=float, default=2000, help='Console lines per second written by the server')
+    parser.add_argument('--players', type=int, default=50, help='Number of players on the server')
+    parser.add_argument('--duration', type=float, default=10, help='Duration of the console scenario, in seconds')
+    parser.add_argument('--commands', type=int, default=200, help='Number of commands posted')
+    parser.add_argument('--concurrency', type=int, default=10, help='Commands posted at the same time')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of Discord requests, in seconds')
+    parser.add_argument('--rate-limited', type=float, default=0.01, help='Fraction of Discord requests getting a 429')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the pass measuring memory')
+    parser.add_argument('--json', metavar='file', help='Write the results to a JSON file')
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or sorted(SCENARIOS)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: {name}'.format(name=name))
+
+    results = measure(args)
+    if not args.no_memory:  # The same scenarios again, timings of this pass are not kept
+        tracemalloc.start()
+        measure(args)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['memory'] = {'python_peak_mib': peak / 2 ** 20, 'python_current_mib': current / 2 ** 20,
+                             'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    for name, values in results.items():
+        print(name)
+        for key, value in values.items():
+            print('  {key:20} {value:>12.2f}'.format(key=key, value=value))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
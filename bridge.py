@@ -0,0 +1,112 @@
+"""Forward messages from Discord to the Minecraft chat."""
+import asyncio
+import collections
+import json
+import time
+
+# Control characters and formatting codes are removed, newlines become spaces
+ESCAPE = dict.fromkeys(range(32))
+ESCAPE.update({ord('\n'): ' ', ord('§'): None})
+MAX_LENGTH = 256  # Longest chat message accepted by the game
+
+
+def escape(text):
+    return text.translate(ESCAPE)[:MAX_LENGTH]
+
+
+class Bridge:
+    """Queue of chat messages, sent in batches as a single `tellraw` command.
+
+    Each user has a small queue and a token bucket. Batches take one
+    message per user in turn, so a busy user can't hold back the others;
+    messages from users over their rate wait, and are dropped when their
+    queue is full."""
+
+    def __init__(self, instance, window, rate, burst, batch):
+        self.instance = instance
+        self.window = window
+        self.rate = rate / 60
+        self.burst = burst
+        self.batch = batch
+        self.queues = collections.OrderedDict()
+        self.tokens = {}
+        self.task = None
+        self.queued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.commands = 0
+
+    def push(self, uid, author, text):
+        """Queue a message, return False if it was dropped."""
+        queue = self.queues.get(uid)
+        if queue is None:
+            queue = self.queues[uid] = collections.deque()
+        if len(queue) >= self.burst:
+            self.dropped += 1
+            self.instance.client.metrics.inc('bridge_messages_dropped_total', server=self.instance.cfg['channel'])
+            return False
+        queue.append((escape(author), escape(text)))
+        self.queued += 1
+        if self.task is None:
+            self.task = self.instance.client.loop.create_task(self.run())
+        return True
+
+    def take(self, uid, now):
+        """Take a token from a user's bucket if one is available."""
+        tokens, updated = self.tokens.get(uid, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.tokens[uid] = (tokens, now)
+            return False
+        self.tokens[uid] = (tokens - 1, now)
+        return True
+
+    def next_batch(self):
+        """Take messages from the queues, one per user in turn."""
+        now = time.monotonic()
+        messages = []
+        progress = True
+        while progress and len(messages) < self.batch:
+            progress = False
+            for uid in list(self.queues):
+                if len(messages) >= self.batch:
+                    break
+                queue = self.queues[uid]
+                if not self.take(uid, now):
+                    continue
+                messages.append(queue.popleft())
+                self.queues.move_to_end(uid)  # Served, goes after the others for the next batch
+                if not queue:
+                    self.queues.pop(uid)
+                progress = True
+        self.queued -= len(messages)
+        if len(self.tokens) > 4 * len(self.queues) + 100:  # Forget full buckets of inactive users
+            self.tokens = {uid: state for uid, state in self.tokens.items()
+                           if uid in self.queues or state[0] + (now - state[1]) * self.rate < self.burst}
+        return messages
+
+    async def run(self):
+        try:
+            while self.queues:
+                await asyncio.sleep(self.window)
+                messages = self.next_batch()
+                if messages:
+                    self.send(messages)
+        finally:
+            self.task = None
+
+    def send(self, messages):
+        components = ['']
+        for author, text in messages:
+            if len(components) > 1:
+                components.append('\n')
+            components.append({'text': '<{author}> '.format(author=author), 'color': 'aqua'})
+            components.append(text)
+        self.instance.console('tellraw @a ' + json.dumps(components, separators=(',', ':')))
+        self.sent += len(messages)
+        self.commands += 1
+
+    def report(self):
+        return 'Chat messages to Minecraft queued: {queued} ({users} users), sent: {sent} in {commands} commands, ' \
+               'dropped: {dropped}'.format(queued=self.queued, users=len(self.queues), sent=self.sent,
+                                           commands=self.commands, dropped=self.dropped)
@@ -0,0 +1,84 @@
+"""Parse console lines and dispatch them to handlers."""
+import asyncio
+import collections
+import re
+import time
+import traceback
+
+LINE = re.compile(r'\[([0-9]{2}):([0-9]{2}):([0-9]{2})\] \[([^][]*)\]: (.*)$')
+
+Line = collections.namedtuple('Line', 'time logger text')
+Handler = collections.namedtuple('Handler', 'func logger pattern background')
+
+
+def parse(raw: str):
+    """Parse a console line, return None if it isn't a log line."""
+    match = LINE.match(raw)
+    if match is None:
+        return None
+    h, m, s, logger, text = match.groups()
+    local = time.localtime()
+    if h == '23' and local.tm_hour == 0:  # In case a line from 23:59 gets parsed at 00:00
+        local = time.localtime(time.time()-3600)
+    log_t = list(local)
+    log_t[3:6] = map(int, (h, m, s))
+    return Line(time.mktime(tuple(log_t)), logger, text)
+
+
+class Classifier:
+    """Dispatch lines to handlers registered by message prefix.
+
+    Handlers are indexed by their prefix, so a line only costs one lookup
+    per distinct prefix length, however many handlers are registered.
+    A handler raising an exception doesn't stop the dispatch, it is only logged."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.lengths = []
+        self.tasks = set()  # Background handlers running
+
+    def register(self, func, prefix='', pattern=None, logger=None, background=False):
+        """Register a coroutine called with (line, match) for matching lines.
+
+        `pattern` is matched against the text if provided, `match` is None otherwise.
+        `logger` restricts the handler to lines from one logger, e.g. `Server thread/INFO`.
+        `background` runs the handler in its own task instead of waiting for it, for
+        handlers doing I/O, e.g. posting to Discord, which must not hold up the console."""
+        if pattern is not None:
+            pattern = re.compile(pattern)
+        # New lists rather than changes in place, dispatch may be iterating over them
+        self.handlers[prefix] = self.handlers.get(prefix, []) + [Handler(func, logger, pattern, background)]
+        self.lengths = sorted(set(self.lengths) | {len(prefix)})
+
+    def unregister(self, func):
+        """Remove all registrations of a handler."""
+        for prefix in list(self.handlers):
+            self.handlers[prefix] = [handler for handler in self.handlers[prefix] if handler.func != func]
+            if not self.handlers[prefix]:
+                self.handlers.pop(prefix)
+        self.lengths = sorted(set(len(prefix) for prefix in self.handlers))
+
+    async def dispatch(self, line: Line):
+        """Call every handler matching a line."""
+        for length in self.lengths:
+            for handler in self.handlers.get(line.text[:length], ()):
+                if handler.logger is not None and handler.logger != line.logger:
+                    continue
+                match = None
+                if handler.pattern is not None:
+                    match = handler.pattern.match(line.text)
+                    if match is None:
+                        continue
+                if handler.background:
+                    task = asyncio.ensure_future(self.run(handler, line, match))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                else:
+                    await self.run(handler, line, match)
+
+    @staticmethod
+    async def run(handler, line, match):
+        try:
+            await handler.func(line, match)
+        except Exception:
+            traceback.print_exc()
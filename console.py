@@ -0,0 +1,155 @@
+"""Send commands to the console of a Minecraft server.
+
+A console transport has a `send` method writing a command without waiting,
+a `request` coroutine sending one or more commands and returning a Response
+(or None if nothing should be replied), and a `close` method. See rcon.Rcon for the RCON transport."""
+import asyncio
+import collections
+import functools
+import re
+import time
+import control
+import logs
+
+Response = collections.namedtuple('Response', 'commands text latency')
+
+# Loggers used by the server for command output
+RESPONSE_LOGGERS = ('Server thread/INFO', 'Server thread/WARN')
+# Lines from these loggers which are not command output, for commands without known output
+NOISE = re.compile(r"<[^\s<>]*> |\S+ (joined|left) the game$|\S+ lost connection: |Can't keep up!|"
+                   r"\S+ has (made the advancement|completed the challenge|reached the goal) |"
+                   r"Saving chunks for level |ThreadedAnvilChunkStorage")
+# Start of the lines answering each command, None for commands answering nothing
+RESPONSES = {
+    'list': r'There are \d+ ',
+    'say': r'\[Server\] ',
+    'tellraw': None,
+    'save-all': r'Sav(ing|ed) the game',
+    'save-on': r'Automatic saving is now |Saving is already ',
+    'save-off': r'Automatic saving is now |Saving is already ',
+    'give': r'Gave ',
+    'tp': r'Teleported ',
+    'teleport': r'Teleported ',
+    'gamerule': r'Game ?rule ',
+    'time': r'Set the time to |The time is ',
+    'weather': r'Set the weather to |Changing to ',
+    'difficulty': r'The difficulty ',
+    'gamemode': r'Set (\S+|own) game mode to ',
+    'kill': r'Killed ',
+    'kick': r'Kicked ',
+    'ban': r'Banned ',
+    'ban-ip': r'Banned ',
+    'pardon': r'Unbanned ',
+    'pardon-ip': r'Unbanned ',
+    'banlist': r'There (are|is) ',
+    'op': r'Made \S+ a server operator',
+    'deop': r'Made \S+ no longer a server operator',
+    'whitelist': r'Added \S+ to the whitelist|Removed \S+ from the whitelist|There (are|is) |Whitelist is |'
+                 r'Reloaded the whitelist|Player is (already|not) whitelisted',
+    'seed': r'Seed: ',
+    'stop': r'Stopping',
+}
+# Errors any command can answer
+ERRORS = (r'Unknown or incomplete command|Incorrect argument|Expected |Invalid |No (player|entity) was found|'
+          r'Nothing changed|That position is not loaded|.*<--\[HERE\]$')
+
+
+def command_name(command: str):
+    name = command.split(' ', 1)[0].lstrip('/')
+    return name[len('minecraft:'):] if name.startswith('minecraft:') else name
+
+
+@functools.lru_cache(maxsize=256)
+def response_pattern(names: frozenset):
+    """Pattern matching the output of commands, None if one of them has no known output."""
+    if not names <= RESPONSES.keys():
+        return None
+    return re.compile('|'.join([ERRORS] + [RESPONSES[name] for name in sorted(names) if RESPONSES[name]]))
+
+
+class Capture:
+    """Console lines following a batch of commands."""
+
+    def __init__(self):
+        self.commands = []
+        self.lines = []
+        self.sent = time.monotonic()
+        self.deadline = self.sent
+        self.latency = None
+        self.pattern = None
+
+    def extend(self, messages):
+        self.commands.extend(messages)
+        self.pattern = response_pattern(frozenset(command_name(command) for command in self.commands))
+
+    def wants(self, text):
+        if self.pattern is None:
+            return not NOISE.match(text)
+        return self.pattern.match(text) is not None
+
+
+class Stdin:
+    """Write commands to the standard input of the server process.
+
+    Responses are captured from the console output following a command,
+    keeping the lines which start like the known output of the commands
+    (see RESPONSES). Commands sent while a capture is open are added to it,
+    and only the first request of a batch gets the response. Requests from
+    the control socket each get their own capture, so their output isn't
+    mixed with the replies posted in Discord."""
+
+    def __init__(self, instance, window):
+        self.instance = instance
+        self.window = window
+        self.captures = {}  # By control request task, None for Discord
+        instance.classifier.register(self.on_line)
+
+    def send(self, message):
+        if not self.instance.running:
+            return
+        self.instance.proc.stdin.write((message + '\n').encode())
+
+    async def request(self, *messages):
+        if not self.instance.running:
+            return None
+        key = control.current_task() if control.replies() is not None else None
+        capture = self.captures.get(key)
+        first = capture is None
+        if first:
+            capture = self.captures[key] = Capture()
+        capture.extend(messages)
+        capture.deadline = time.monotonic() + self.window
+        self.send('\n'.join(messages))  # A single write for the whole batch
+        if not first:
+            return None
+        while capture.deadline > time.monotonic():
+            await asyncio.sleep(capture.deadline - time.monotonic())
+        if self.captures.get(key) is capture:
+            del self.captures[key]
+        return Response(capture.commands, '\n'.join(capture.lines), capture.latency)
+
+    async def on_line(self, line, match):
+        if not self.captures or line.logger not in RESPONSE_LOGGERS:
+            return
+        for capture in self.captures.values():
+            if not capture.wants(line.text):
+                continue
+            if capture.latency is None:
+                capture.latency = time.monotonic() - capture.sent
+            capture.lines.append(line.text)
+
+    def close(self, error=None):
+        self.captures.clear()
+
+
+def format_pages(response: Response, limit=1800):
+    """Format a response as messages, the output being split into pages."""
+    commands = ', '.join('`{command}`'.format(command=command.replace('`', "'")) for command in response.commands)
+    if len(commands) > 200:
+        commands = commands[:200] + '...'
+    text = re.sub('§.', '', response.text).replace('`', "'")
+    if response.latency is None:
+        return ['{commands}: no response.'.format(commands=commands)]
+    return ['{commands} ({latency:.0f} ms)\n```\n{text}\n```'.format(
+        commands=commands, latency=response.latency * 1000, text=page)
+        for page in logs.split_pages(text.split('\n'), limit)]
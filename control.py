@@ -0,0 +1,178 @@
+"""Local control socket: run commands without going through Discord.
+
+Clients connect to a Unix socket and write one JSON request per line:
+
+    {"id": 1, "server": "[MC0]", "command": "give Steve stone; tp Steve 0 64 0"}
+    {"id": 2, "subscribe": true}
+
+Each request gets a response with the same id, holding the messages the
+command would have posted in Discord. Requests run concurrently, so
+responses may come out of order. A subscription streams console lines as
+{"event": "console", ...} objects. Connections are authenticated by the
+uid of the connecting process, mapped to a role by `control-users`."""
+import asyncio
+import json
+import os
+import socket
+import struct
+
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+# Messages posted by commands running for a control request, by task
+REPLIES = {}
+MAX_PENDING = 32  # Requests running at once for a connection
+MAX_BUFFER = 2 ** 20  # Events are dropped for subscribers not reading fast enough
+
+
+def replies():
+    """Messages of the control request running in the current task, None outside of requests."""
+    return REPLIES.get(current_task()) if REPLIES else None
+
+
+def peer_uid(writer):
+    creds = writer.get_extra_info('socket').getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid
+
+
+class Caller:
+    """Stands for a Discord user in commands run through the socket.
+
+    `role` is the name of the role given to the uid in `control-users`."""
+
+    def __init__(self, uid, role):
+        self.id = 'unix:{uid}'.format(uid=uid)
+        self.name = self.nick = self.mention = 'uid {uid}'.format(uid=uid)
+        self.role = role
+
+
+class Connection:
+    def __init__(self, control, reader, writer):
+        self.control = control
+        self.client = control.client
+        self.reader = reader
+        self.writer = writer
+        uid = peer_uid(writer)
+        self.uid = uid
+        self.caller = Caller(uid, self.client.cfg['control-users'].get(str(uid)))
+        self.pending = asyncio.Semaphore(MAX_PENDING)
+        self.dropped = 0
+
+    @property
+    def role(self):
+        return self.client.perms.get_role(self.caller.role or '')
+
+    def write(self, obj):
+        self.writer.write(json.dumps(obj).encode() + b'\n')
+
+    async def serve(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                await self.pending.acquire()  # Stop reading when too many requests are running
+                self.client.loop.create_task(self.handle(line))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.control.unsubscribe(self)
+            self.writer.close()
+
+    async def handle(self, line):
+        request_id = None
+        try:
+            request = json.loads(line.decode())
+            request_id = request.get('id')
+            result = await self.run(request)
+            self.write(dict(result, id=request_id, ok=True))
+        except Exception as e:  # Whatever happens, the request gets its response
+            self.write({'id': request_id, 'ok': False, 'error': str(e) or type(e).__name__})
+        finally:
+            self.pending.release()
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def run(self, request):
+        if not self.role:
+            raise ValueError('No role is assigned to this uid')
+        if 'subscribe' in request:
+            if request['subscribe']:
+                self.control.subscribe(self)
+            else:
+                self.control.unsubscribe(self)
+            return {'subscribed': self in self.control.subscribers}
+        server = self.control.find(request.get('server'))
+        task = current_task()
+        REPLIES[task] = messages = []
+        try:
+            await server.run(self.caller, request['command'], role=self.role)
+        finally:
+            REPLIES.pop(task)
+        return {'replies': messages}
+
+    def event(self, event):
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.dropped += 1
+            return
+        self.write(event)
+
+
+class Control:
+    """Unix socket server accepting control connections."""
+
+    def __init__(self, client):
+        self.client = client
+        self.path = client.cfg['control-socket']
+        self.subscribers = set()
+        self.handlers = {}
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left over by a previous run
+        await asyncio.start_unix_server(self.accept, self.path)
+
+    async def accept(self, reader, writer):
+        try:
+            connection = Connection(self, reader, writer)
+        except OSError:
+            writer.close()
+            return
+        await connection.serve()
+
+    def find(self, name):
+        """Find a server by its channel or short name, or the only server if none is given."""
+        servers = self.client.servers
+        if name is None and len(servers) == 1:
+            return next(iter(servers.values()))
+        for server in servers.values():
+            if name in (server.cfg['channel'], server.cfg['short-name']):
+                return server
+        raise ValueError('Unknown server: {name}'.format(name=name))
+
+    def subscribe(self, connection):
+        """Stream console lines to a connection. Lines are only handled while someone subscribed."""
+        if not self.subscribers:
+            for server in self.client.servers.values():
+                self.handlers[server] = self.on_line_for(server)
+                server.classifier.register(self.handlers[server])
+        self.subscribers.add(connection)
+
+    def unsubscribe(self, connection):
+        if connection not in self.subscribers:
+            return
+        self.subscribers.discard(connection)
+        if not self.subscribers:
+            for server, handler in self.handlers.items():
+                server.classifier.unregister(handler)
+            self.handlers.clear()
+
+    def on_line_for(self, server):
+        async def on_line(line, match):
+            event = {'event': 'console', 'server': server.cfg['short-name'] or server.cfg['channel'],
+                     'time': line.time, 'logger': line.logger, 'text': line.text}
+            for connection in list(self.subscribers):
+                connection.event(event)
+        return on_line
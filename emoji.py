@@ -14,11 +14,23 @@ CHAT_STOP = '🔇'
 CHAT_SHELL = '📩'
 ERROR_MAIN = '❌'
 ERROR_PERM = '⛔'
+PAGE_PREV = '⏪'
+PAGE_NEXT = '⏩'
 
 TRIGGERS = {
     'eula': [ACCEPT_EULA],
     'start': [START_SRV],
     'control': [STOP_SRV, KILL_SRV, RESTART_SRV],
     'chat': [CHAT_SHELL, CHAT_STOP],
-    'chat_init': [CHAT_START]
+    'chat_init': [CHAT_START],
+    'page': [PAGE_PREV, PAGE_NEXT]
+}
+
+# Command run when a button is clicked, by trigger tag and emoji
+ACTIONS = {
+    'eula': {ACCEPT_EULA: ('eula', '')},
+    'start': {START_SRV: ('start', '')},
+    'control': {STOP_SRV: ('stop', ''), KILL_SRV: ('kill', ''), RESTART_SRV: ('restart', '')},
+    'chat': {CHAT_SHELL: ('shell', 'chat'), CHAT_STOP: ('chat', 'false')},
+    'chat_init': {CHAT_START: ('chat', 'true')}
 }
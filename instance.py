@@ -0,0 +1,867 @@
+"""A Minecraft server managed from one Discord channel."""
+import asyncio
+import collections
+import fcntl
+import inspect
+import os
+import re
+import subprocess
+import time
+import discord
+import backup
+import bridge
+import classifier
+import console
+import control
+import emoji
+import live
+import logs
+import players
+import rcon
+import region
+import sender
+import supervisor
+import telemetry
+import triggers
+
+# Command of the dispatch table: its function, the permission it requires,
+# and which of the `args`, `user` and `instance` arguments it takes
+Command = collections.namedtuple('Command', 'func permission args user instance')
+
+
+def command(func, permission):
+    """Build a dispatch table entry, inspecting the function once."""
+    parameters = inspect.signature(func).parameters
+    return Command(func, permission, 'args' in parameters, 'user' in parameters, 'instance' in parameters)
+
+
+def split_commands(text):
+    """Split `;`-separated commands into (command, args) pairs."""
+    commands = []
+    for part in text.split(';'):
+        part = part.strip()
+        if part:
+            cmd, _, args = part.partition(' ')
+            commands.append((cmd, args.strip()))
+    return commands
+
+
+class Instance:
+    """One Minecraft server, its process and its channel."""
+
+    def __init__(self, client, config):
+        self.client = client
+        self.cfg: dict = config
+        self.channel: discord.Channel = None
+        self.proc: asyncio.subprocess.Process = None
+        self.lifecycle = 'stopped'
+        self.spawned = 0
+        self.restarted = None
+        self.pruning = False  # Region files are being rewritten, the server must not start
+        self.queued = collections.deque(maxlen=config['console-buffer'])
+        self.startups = collections.deque(maxlen=10)
+        self.triggers = triggers.Triggers(self, os.path.join(config['mc-directory'], config['trigger-file']))
+        self.me: discord.Member = None
+        self.chat: bool = False
+        self.shells: dict = {}
+        self.chat_message: discord.Message = None
+        self.chat_last: discord.Message = None
+        self.last_message_id: int = 0
+        self.chat_buffer = sender.Coalescer(self.flush_chat, config['chat-flush'], config['chat-buffer'], client.loop)
+        self.history = logs.History(config['log-history'])
+        self.archive = logs.Archive(os.path.join(config['mc-directory'], config['log-directory']),
+                                    config['log-segment-size'], config['log-segments'])
+        self.archive_buffer = sender.Coalescer(self.flush_archive, 5, config['console-buffer'] * 10, client.loop,
+                                               batch=config['console-buffer'])
+        self.commands = {}
+        self.table = {}
+        self.macros = {}
+        self.shell_commands = {'chat': self.shell_chat}
+        self.bridge = bridge.Bridge(self, config['bridge-flush'], config['bridge-rate'], config['bridge-burst'],
+                                    config['bridge-batch'])
+        self.classifier = classifier.Classifier()
+        self.classifier.register(self.on_done, 'Done (', r'Done \(([0-9.,]+)s\)!', background=True)
+        self.classifier.register(self.on_eula, 'You need to agree to the EULA in order to run the server.',
+                                 background=True)
+        self.classifier.register(self.on_chat, '<', r'<([^\s<>]*)> (.*)')
+        self.classifier.register(self.on_server_chat, '[Server] ', r'\[Server\] (?!<)(.*)')  # Skip bridge messages
+        if config['rcon-port']:
+            self.transport = rcon.Rcon(config['rcon-host'], config['rcon-port'], config['rcon-password'], client.loop)
+        else:
+            self.transport = console.Stdin(self, config['response-window'])
+        self.supervisor = supervisor.Supervisor(self)
+        self.telemetry = telemetry.Telemetry(self)
+        self.backup = backup.Backup(self)
+        self.live = live.Live(self)
+        self.pager = live.Pager(self)
+        self.players = players.Players(self, os.path.join(config['mc-directory'], config['players-database']),
+                                       config['players-flush'])
+        for task in config['schedule']:  # Here rather than in on_ready, which runs again after reconnecting
+            if 'at' in task:
+                hour, minute = map(int, task['at'].split(':'))
+                client.scheduler.daily(hour, minute, self.console, task['command'])
+            else:
+                client.scheduler.every(task['every'], self.console, task['command'])
+
+    # discord.py events, routed by the client
+
+    async def on_message(self, message):
+        self.last_message_id = max(self.last_message_id, int(message.id))
+        if message.author == self.me:
+            return  # Can't reply to self
+        try:
+            prefix, text = message.content.split(None, 1)
+        except ValueError:
+            prefix, text = '', message.content
+        if prefix not in self.client.prefixes:  # Must start with prefix, or be a shell
+            if message.author.id in self.shells:  # Active shell
+                await self.shell_wrapper(message.author, message.clean_content)
+            return
+        if len(text) == 0:
+            return  # No empty messages
+        await self.run(message.author, text)
+
+    async def on_reaction_add(self, reaction: discord.Reaction, user):
+        if user == self.me:  # No reacting to self
+            return
+        tags = self.triggers.tags_of(reaction.message.id)
+        if 'page' in tags and reaction.emoji in emoji.TRIGGERS['page']:
+            if not self.client.perms[user.id]:
+                return
+            try:  # Remove the reaction so it can be clicked again
+                await self.client.remove_reaction(reaction.message, reaction.emoji, user)
+            except discord.HTTPException:
+                pass
+            await self.pager.turn(-1 if reaction.emoji == emoji.PAGE_PREV else 1)
+            return
+        for tag in tags:  # Only the buttons added by the client trigger an action
+            action = emoji.ACTIONS.get(tag, {}).get(reaction.emoji)
+            if action is not None:
+                await self.call(user, *action, reaction=True)
+                return
+
+    async def on_ready(self, first=True):
+        """Set up the channel, and on the first ready of the client, the buttons and the server."""
+        self.channel = self.client.get_channel(self.cfg['channel'])
+        self.me = self.channel.server.me
+        self.commands = dict(self.client.commands)
+        self.commands.update({'help': self.help,
+                              'start': self.start_server, 'stop': self.stop_server, 'restart': self.restart_server,
+                              'kill': self.kill_server, 'eula': self.accept_eula, 'chat': self.set_chat,
+                              'shell': self.shell_activate, 'queue': self.queue_stats,
+                              'tail': self.tail, 'grep': self.grep, 'logs': self.search_logs,
+                              'incidents': self.show_incidents, 'stats': self.show_stats,
+                              'status': self.status, 'backup': self.backup_command,
+                              'regions': self.regions, 'who': self.who, 'seen': self.seen,
+                              'playtime': self.playtime, 'console': self.console_view})
+        self.table = {name: command(func, name) for name, func in self.commands.items()}
+        self.macros = {name: split_commands(text) for name, text in self.cfg['macros'].items()}
+        if not first:  # Reconnected, the buttons and the server are as they were
+            return
+        await self.triggers.load()
+        if self.running:
+            return
+        for tag in list(self.triggers.tags):
+            if tag not in ('start', 'eula'):  # Buttons of a server that isn't running anymore
+                await self.set_trigger(tag, None)
+        if 'start' not in self.triggers:
+            await self.send_tag('start', emoji.START_SRV, "Hi everyone!")
+        if self.cfg['mc-autostart']:
+            await self.start_server()
+
+    # discord-related functions
+
+    def label(self, message):
+        """Prefix a message with the short name of the server."""
+        if isinstance(message, str) and len(self.cfg['short-name']) > 0:
+            message = ' '.join((self.cfg['short-name'], message))
+        return message
+
+    async def send(self, message, *args, **kwargs):
+        """Shortcut for send_message.
+
+        Returns None when replying to a control socket request instead of Discord."""
+        replies = control.replies()
+        if replies is not None:
+            replies.append(message)
+            return None
+        return await self.client.send_message(self.channel, self.label(message), *args, **kwargs)
+
+    async def send_react(self, reactions, *args, **kwargs):
+        """Send a message and add reactions to it."""
+        message = await self.send(*args, **kwargs)
+        if message is None:
+            return None
+        if isinstance(reactions, str):  # Handle two-character emojis
+            reactions = (reactions,)
+        for reaction in reactions:
+            await self.client.add_reaction(message, reaction)
+        return message
+
+    async def send_tag(self, tag, reactions, *args, **kwargs):
+        """Send a message with reactions and add it as a trigger."""
+        message = await self.send_react(reactions, *args, **kwargs)
+        if message is not None:
+            await self.set_trigger(tag, message)
+        return message
+
+    async def send_delete(self, timeout, message, *args, **kwargs):
+        """Send a message, and delete it after a certain amount of time."""
+        msg = await self.send(message, *args, **kwargs)
+        if msg is not None:
+            self.client.scheduler.call_later(timeout, self.client.delete_message, msg)
+
+    async def send_error(self, message, *args, **kwargs):
+        if isinstance(message, str):
+            message = emoji.ERROR_MAIN + ' ' + message
+        await self.send(message, *args, **kwargs)
+
+    async def send_error_perms(self, message, *args, **kwargs):
+        if isinstance(message, str):
+            message = emoji.ERROR_PERM + ' ' + message
+        await self.send_delete(10, message, *args, **kwargs)
+
+    async def set_trigger(self, tag, message):
+        """Set/change a trigger message.
+
+        Triggers are messages with reactions added by the client,
+        which can be clicked by the user to do certain actions."""
+        if tag in self.triggers:
+            message_id, msg = self.triggers.pop(tag)
+            if msg is None:
+                try:
+                    msg = await self.client.get_message(self.channel, message_id)
+                except discord.NotFound:
+                    pass
+            if msg is not None:
+                # Remove reactions on the previous trigger (from this tag)
+                for reaction in emoji.TRIGGERS[tag]:
+                    try:
+                        await self.client.remove_reaction(msg, reaction, self.me)
+                    except discord.HTTPException:
+                        pass
+        if message is not None:
+            self.triggers.add(tag, message)
+
+    async def flush_chat(self, lines):
+        """Send buffered chat lines, appending them to the last chat message if possible."""
+        if not self.chat:
+            return
+        last = self.chat_last
+        if last is not None and int(last.id) == self.last_message_id:
+            content = '\n'.join([last.content] + lines)
+            if len(content) <= 2000:
+                self.chat_last = await self.client.edit_message(last, content)
+                return
+        messages = ['']
+        for line in lines:
+            line = line[:2000 - len(self.cfg['short-name']) - 1]
+            if len(messages[-1]) + len(line) + len(self.cfg['short-name']) + 2 > 2000:
+                messages.append('')
+            messages[-1] = '\n'.join((messages[-1], line)) if messages[-1] else line
+        for message in messages[:-1]:
+            await self.send(message)
+        # Only the last message gets the buttons, so triggers move once per flush
+        self.chat_last = await self.send_tag('chat', emoji.TRIGGERS['chat'], messages[-1])
+
+    async def queue_stats(self):
+        """Display statistics about outgoing messages."""
+        requests = ', '.join('{route}: {count}'.format(route=route, count=count)
+                             for route, count in sorted(self.client.sender.requests.items()))
+        await self.send('Requests waiting: {waiting}\nRequests sent: {requests}\n'
+                        'Chat lines buffered: {buffered}, dropped: {dropped}, flushes: {flushes}\n'
+                        'Archived lines buffered: {archive_buffered}, dropped: {archive_dropped}\n{bridge}'.format(
+                            waiting=self.client.sender.waiting, requests=requests or 'none',
+                            buffered=len(self.chat_buffer.lines), dropped=self.chat_buffer.dropped,
+                            flushes=self.chat_buffer.flushes, archive_buffered=len(self.archive_buffer.lines),
+                            archive_dropped=self.archive_buffer.dropped, bridge=self.bridge.report()))
+
+    async def help(self, args):
+        """Displays this help message.
+        Use `help <command>` for more information about a specific command."""
+        if not args:
+            maxw = max([len(x) for x in self.commands]) + 1
+            commands = list(self.commands)
+            commands.sort()
+            message = '\n'.join(['`{name:{width}}|` {desc}'.format(
+                name=command, width=maxw,
+                desc=(self.commands[command].__doc__ or 'No description.').splitlines()[0]
+            ) for command in commands])
+            if self.macros:
+                message += '\nMacros: ' + ', '.join('`{name}`'.format(name=name) for name in sorted(self.macros))
+            await self.send("Unlisted commands are forwarded to the Minecraft server.\n" + message)
+        elif args.lower() in self.macros:
+            await self.send("**`{name}`** - macro: `{text}`".format(name=args.lower(), text=self.cfg['macros'][args.lower()]))
+        elif args.lower() not in self.commands:
+            await self.send_error("Unknown command: {command}. This might be a Minecraft command.".format(command=args))
+        else:
+            args = args.lower()
+            await self.send("**`{name}`** - {doc}".format(name=args, doc=self.commands[args].__doc__ or 'No description.'))
+
+    # shells
+
+    async def shell_activate(self, user: discord.Member, args):
+        shell_name = args.split()[0].lower()
+        shell = self.shell_commands.get(shell_name)
+        if shell is None:
+            return
+        if '${shell}'.format(shell=shell_name) not in self.client.perms[user.id]:
+            await self.send_error_perms("{user}, your are not allowed to start the shell `{shell}`".format(
+                user=user.mention, shell=shell_name))
+            return
+        if user.id in self.shells:
+            if self.shells[user.id]['shell'] != shell:
+                await self.send('Another shell is already activated for ' + user.mention + ' (quit with `exit`)')
+            return
+        self.shells[user.id] = {'shell': shell, 'active': time.monotonic(), 'timer': self.client.scheduler.call_later(
+            self.cfg['shell-timeout'], self.shell_expire, user)}
+        await self.send('Shell initiated for ' + user.mention)
+
+    async def shell_terminate(self, user: discord.Member, reason=None):
+        if user.id not in self.shells:
+            return
+        message = 'Shell terminated for {user}'.format(user=user.mention)
+        if reason is not None:
+            message = '{msg} ({reason})'.format(msg=message, reason=reason)
+        self.client.scheduler.cancel(self.shells.pop(user.id)['timer'])
+        await self.send(message)
+
+    async def shell_expire(self, user: discord.Member):
+        """Terminate a shell if it wasn't used since its timeout, check again later otherwise."""
+        sh = self.shells.get(user.id)
+        if sh is None:
+            return
+        remaining = sh['active'] + self.cfg['shell-timeout'] - time.monotonic()
+        if remaining > 0:
+            sh['timer'] = self.client.scheduler.call_later(remaining, self.shell_expire, user)
+        else:
+            await self.shell_terminate(user, 'timed out')
+
+    async def shell_terminate_all(self, shell):
+        uids = [uid for (uid, sh) in self.shells.items() if sh['shell'] == shell]
+        for uid in uids:
+            self.client.scheduler.cancel(self.shells.pop(uid)['timer'])
+        await self.send('All `' + shell.__name__[6:] + '` shells terminated.')
+
+    async def shell_wrapper(self, user: discord.Member, message: str):
+        if user.id not in self.shells:
+            return
+        if message.lower() == 'exit':
+            await self.shell_terminate(user)
+            return
+        sh = self.shells[user.id]
+        sh['active'] = time.monotonic()  # The timer checks it when it expires
+        self.client.metrics.inc('shell_messages_total', shell=sh['shell'].__name__[6:])
+        await sh['shell'](user, message)
+
+    async def shell_chat(self, user: discord.Member, message: str):
+        """Forward user messages to Minecraft."""
+        self.bridge.push(user.id, user.nick or user.name, message)
+
+    # server-related events
+
+    async def read_stream(self, stream: asyncio.StreamReader, lines: asyncio.Queue):
+        """Feed raw lines from one of the server's output streams into the console queue."""
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:  # Line longer than the stream limit, skip it
+                self.client.metrics.inc('console_lines_dropped_total', server=self.cfg['channel'])
+                continue
+            if not line:
+                break
+            await lines.put(line)  # Blocks when the queue is full, applying backpressure on the pipe
+        await lines.put(None)
+
+    async def read_console(self, proc, lines: asyncio.Queue, streams=2):
+        """Loop through the console output of a process"""
+        while streams > 0:
+            line = await lines.get()
+            if line is None:  # One of the streams reached EOF
+                streams -= 1
+                continue
+            self.client.metrics.inc('console_lines_total', server=self.cfg['channel'])
+            line = classifier.parse(line.decode(errors='replace').rstrip('\r\n'))
+            if line is not None:
+                self.history.append(line)
+                if self.archive_buffer.push(line):  # The archive can't keep up
+                    self.client.metrics.inc('archive_lines_dropped_total', server=self.cfg['channel'])
+                await self.classifier.dispatch(line)
+        if proc is self.proc:  # Not replaced by a prewarmed server, whose players are still online
+            self.players.leave_all()
+
+    async def flush_archive(self, lines):
+        await self.client.loop.run_in_executor(None, self.archive.write, lines)
+
+    async def on_done(self, line, match):
+        """The server finished loading."""
+        if self.lifecycle != 'starting':
+            return
+        self.lifecycle = 'ready'
+        duration = time.monotonic() - self.spawned
+        self.startups.append((time.time(), duration))
+        while self.queued:
+            self.transport.send(self.queued.popleft())
+        message = 'Server ready in {time:.1f}s'.format(time=duration)
+        if self.restarted is not None:
+            message += ' ({time:.1f}s of downtime)'.format(time=time.monotonic() - self.restarted)
+            self.restarted = None
+        await self.send(message)
+        await self.supervisor.ready()
+
+    async def on_eula(self, line, match):
+        """EULA error, ask for agreement."""
+        self.supervisor.stopping()  # The server exits right after
+        message = "You need to agree to Mojang's End-User License Agreement in order to run the server.\n" \
+            "For more information, please visit <https://account.mojang.com/documents/minecraft_eula>.\n" \
+            "By clicking the button below you are indicating your agreement to Mojang's EULA."
+        await self.send_tag('eula', emoji.ACCEPT_EULA, message)
+
+    async def on_chat(self, line, match):
+        """Chat message, forward it if chat is enabled."""
+        if not self.chat:
+            return
+        author, message = match.groups()
+        self.chat_buffer.push(f'**{author}**: {message}')
+
+    async def on_server_chat(self, line, match):
+        """Message sent with `say`, forward it if chat is enabled."""
+        if self.chat:
+            self.chat_buffer.push(f'**SERVER**: {match.group(1)}')
+
+    # server-related functions
+
+    async def call(self, user: discord.Member, command, args='', reaction=False):
+        """Call a command, checking your privilege."""
+        user_perms = self.client.perms[user.id]
+        if not await self.check(user, user_perms, command):
+            return
+        if command in self.table:
+            await self.invoke(user, command, args)
+        else:
+            await self.forward([' '.join((command, args))])
+
+    async def run(self, user: discord.Member, text, role=None):
+        """Run `;`-separated commands and macros.
+
+        Permissions are checked for every command before any of them runs, against
+        the role of the user unless another one is given.
+        Consecutive Minecraft commands are sent to the server together."""
+        user_perms = self.client.perms[user.id] if role is None else role
+        commands = []
+        for cmd, args in split_commands(text):
+            if cmd in self.macros:
+                if not await self.check(user, user_perms, cmd):
+                    return
+                commands.extend(self.macros[cmd])
+            else:
+                commands.append((cmd, args))
+        for cmd, args in commands:
+            if not await self.check(user, user_perms, cmd):
+                return
+        batch = []
+        for cmd, args in commands:
+            if cmd not in self.table:
+                batch.append(' '.join((cmd, args)))
+                continue
+            if batch:
+                await self.forward(batch)
+                batch = []
+            await self.invoke(user, cmd, args)
+        if batch:
+            await self.forward(batch)
+
+    async def check(self, user: discord.Member, user_perms, command):
+        """Check that a user may run a command, tell them otherwise."""
+        entry = self.table.get(command)
+        if (command if entry is None else entry.permission) in user_perms:
+            return True
+        if user_perms:  # Don't display the message if the user has no permissions at all
+            await self.send_error_perms("{user}, you are not allowed to use the command `{command}`".format(
+                user=user.mention, command=command))
+        return False
+
+    async def invoke(self, user: discord.Member, command, args):
+        """Call a command of the dispatch table."""
+        entry = self.table[command]
+        start = self.client.metrics.start()
+        kw = {}
+        if entry.args:
+            kw['args'] = args
+        if entry.user:
+            kw['user'] = user
+        if entry.instance:
+            kw['instance'] = self
+        await entry.func(**kw)
+        self.client.metrics.observe('command_seconds', start, command=command)
+
+    async def forward(self, commands):
+        """Send commands to the Minecraft server and display the response."""
+        commands = [command.split('\n')[0].strip() for command in commands]
+        if self.state == 'starting':
+            for command in commands:
+                self.console(command)
+            await self.send('The server is starting, {commands} will be sent once it is ready.'.format(
+                commands=', '.join('`{command}`'.format(command=command) for command in commands)))
+            return
+        start = self.client.metrics.start()
+        try:
+            response = await self.transport.request(*commands)
+        except rcon.RconError as e:
+            await self.send_error(str(e))
+            return
+        self.client.metrics.observe('command_seconds', start, command='forwarded')
+        if response is not None:
+            await self.pager.show(console.format_pages(response))
+
+    async def tail(self, args):
+        """Display the last lines of the console.
+        Use `tail <count>` to choose how many lines to display."""
+        count = int(args) if args.isdigit() else 10
+        await self.send(logs.format_lines(self.history.tail(count)))
+
+    async def grep(self, args):
+        """Search recent console lines.
+        Use `grep <pattern>` to display recent lines matching a regular expression."""
+        try:
+            lines = self.history.grep(args, len(self.history.lines))
+        except re.error as e:
+            await self.send_error('Invalid pattern: {error}'.format(error=e))
+            return
+        await self.pager.show(logs.format_pages(lines), -1)
+
+    async def search_logs(self, args):
+        """Search the console log archive.
+        Use `logs <minutes> [pattern]` to display lines from the last minutes,
+        optionally matching a regular expression."""
+        minutes, _, pattern = args.partition(' ')
+        try:
+            minutes = float(minutes)
+            re.compile(pattern)
+        except (ValueError, re.error):
+            await self.send_error('Usage: `logs <minutes> [pattern]`')
+            return
+        end = time.time()
+        lines = await self.client.loop.run_in_executor(None, self.archive.query, end - minutes * 60, end, pattern,
+                                                       self.cfg['log-query-limit'])
+        await self.pager.show(logs.format_pages(lines), -1)
+
+    async def console_view(self, args):
+        """Keep a pinned message showing the last console lines.
+        Use `console live` to start it and `console off` to stop it."""
+        if args.strip() == 'live':
+            await self.live.start()
+        elif args.strip() == 'off':
+            await self.live.stop()
+        else:
+            await self.send_error('Usage: `console live` or `console off`')
+
+    async def show_incidents(self):
+        """Display recent crashes and hangs of the server."""
+        await self.send('```\n{report}\n```'.format(report=self.supervisor.report()))
+
+    async def status(self):
+        """Display the state of the server and its recent startup times."""
+        message = 'Server is {state}.'.format(state=self.state)
+        if self.startups:
+            message += ' Recent startups: ' + ', '.join('{time:.1f}s'.format(time=duration)
+                                                       for timestamp, duration in self.startups)
+        await self.send(message)
+
+    async def backup_command(self, args):
+        """Back up the server directory.
+        Use `backup` to take a snapshot without stopping the server, `backup list` to list snapshots,
+        and `backup restore <name>` to extract a snapshot into the backup directory."""
+        loop = self.client.loop
+        action, _, name = args.partition(' ')
+        if action == 'list':
+            names = await loop.run_in_executor(None, self.backup.store.list)
+            await self.send('Snapshots: ' + (', '.join('`{name}`'.format(name=name) for name in names) or 'none'))
+        elif action == 'restore':
+            if name not in await loop.run_in_executor(None, self.backup.store.list):
+                await self.send_error('Unknown snapshot `{name}`.'.format(name=name))
+                return
+            target = os.path.join(self.backup.store.directory, 'restore-' + name)
+            await loop.run_in_executor(None, self.backup.store.restore, name, target)
+            await self.send('Snapshot `{name}` extracted to `{target}`.'.format(name=name, target=target))
+        elif self.backup.running:
+            await self.send_error('A backup is already running.')
+        elif self.state in ('starting', 'stopping'):
+            await self.send_error('The server is {state}, try again later.'.format(state=self.state))
+        else:
+            self.backup.running = True
+            try:
+                stats = await self.backup.run()
+            except (OSError, asyncio.TimeoutError, rcon.RconError) as e:
+                await self.send_error('Backup failed: {error}'.format(error=str(e) or type(e).__name__))
+                return
+            finally:
+                self.backup.running = False
+            await self.send('Snapshot `{name}`: {files} files, {changed} new or changed, {size:.1f} MiB written, '
+                            'saving paused for {paused:.1f}s, {removed} old objects removed.'.format(
+                                size=stats['written'] / 2 ** 20, **stats))
+
+    async def regions(self, args):
+        """Analyze region files of the world.
+        Use `regions` to count chunks and stale chunks (rarely visited by players) in each dimension.
+        `regions prune` stops the server, deletes stale chunks so they are generated again, and restarts it."""
+        world = self.world_directory()
+        stale, workers = self.cfg['region-stale-ticks'], self.cfg['region-workers']
+        loop = self.client.loop
+        if args.strip() != 'prune':
+            start = time.monotonic()
+            stats = await loop.run_in_executor(None, region.analyze, world, stale, workers)
+            lines = ['{:20} {:>6} {:>8} {:>8} {:>9}'.format('dimension', 'files', 'chunks', 'stale', 'size')]
+            lines.extend('{:20} {:>6} {:>8} {:>8} {:>5.0f} MiB'.format(
+                s.dimension, s.files, s.chunks, s.stale, s.size / 2 ** 20) for s in stats)
+            await self.send('```\n{table}\n```Analyzed in {time:.1f}s.'.format(
+                table='\n'.join(lines), time=time.monotonic() - start))
+            return
+        if self.pruning or self.state in ('starting', 'stopping'):
+            await self.send_error('The server is {state}, try again later.'.format(
+                state='being pruned' if self.pruning else self.state))
+            return
+        was_running = self.running
+        if not was_running and (self.world_locked() or await self.rcon_answers()):
+            await self.send_error('The server is running outside of minecord, stop it before pruning.')
+            return
+        self.pruning = True
+        try:
+            if was_running:
+                await self.stop_server()
+            removed, freed = await loop.run_in_executor(None, region.prune, world, stale, workers)
+        finally:
+            self.pruning = False
+        await self.send('Removed {removed} stale chunks, freed {size:.1f} MiB.'.format(removed=removed,
+                                                                                    size=freed / 2 ** 20))
+        if was_running:
+            await self.start_server()
+
+    async def rcon_answers(self):
+        """Whether a server answers on the RCON port, through a new connection to skip any backoff."""
+        if not self.cfg['rcon-port']:
+            return False
+        connection = rcon.Rcon(self.cfg['rcon-host'], self.cfg['rcon-port'], self.cfg['rcon-password'],
+                               self.client.loop, timeout=5)
+        try:
+            await connection.command(supervisor.PROBE)
+        except rcon.RconError:
+            return False
+        finally:
+            connection.close()
+        return True
+
+    async def who(self):
+        """List the players online."""
+        online = sorted(self.players.online)
+        await self.send('{count} players online: {names}'.format(count=len(online), names=', '.join(online))
+                        if online else 'Nobody is online.')
+
+    async def seen(self, args):
+        """Display when a player was last online.
+        Use `seen <player>`."""
+        name = args.strip()
+        if name in self.players.online:
+            await self.send('**{name}** is online.'.format(name=name))
+        elif name in self.players.players:
+            player = self.players.players[name]
+            await self.send('**{name}** was last seen {date}, {deaths} deaths in {sessions} sessions.'.format(
+                name=name, date=time.strftime('%Y-%m-%d %H:%M', time.localtime(player.last_seen)),
+                deaths=player.deaths, sessions=player.sessions))
+        else:
+            await self.send_error('**{name}** was never seen.'.format(name=name))
+
+    async def playtime(self, args):
+        """Display the play time of a player.
+        Use `playtime <player>`, the current session is included."""
+        name = args.strip()
+        if name not in self.players.players:
+            await self.send_error('**{name}** was never seen.'.format(name=name))
+            return
+        hours, minutes = divmod(int(self.players.playtime(name)) // 60, 60)
+        await self.send('**{name}** played for {hours}h{minutes:02}.'.format(name=name, hours=hours,
+                                                                               minutes=minutes))
+
+    async def show_stats(self):
+        """Display resource usage and tick lag of the server."""
+        await self.send('```\n{report}\n```'.format(report=self.telemetry.report()))
+
+    async def accept_eula(self):
+        """Accept Mojang's EULA.
+        By using this command, you agree to Mojang's End-User License Agreement.
+        For more information, please visit <https://account.mojang.com/documents/minecraft_eula>."""
+        eula = os.path.join(self.cfg['mc-directory'], 'eula.txt')
+        content = open(eula).read().replace('eula=false', 'eula=true')
+        open(eula, 'w').write(content)
+        await self.set_trigger('eula', None)
+        await self.send_tag('start', emoji.START_SRV, 'EULA accepted. You can now start the server.')
+
+    @property
+    def running(self):
+        """Whether or not the server process is alive."""
+        return self.proc is not None and self.proc.returncode is None
+
+    @property
+    def state(self):
+        """Lifecycle state of the server: stopped, starting, ready or stopping."""
+        return self.lifecycle if self.running else 'stopped'
+
+    def console(self, message):
+        """Send a command to the server, or queue it until the server is ready."""
+        message = message.split('\n')[0]
+        if self.state == 'starting':
+            self.queued.append(message)
+        else:
+            self.transport.send(message)
+
+    def world_directory(self):
+        """Path of the world, from `level-name` in server.properties."""
+        level = 'world'
+        try:
+            for line in open(os.path.join(self.cfg['mc-directory'], 'server.properties')):
+                if line.startswith('level-name='):
+                    level = line.split('=', 1)[1].strip()
+        except FileNotFoundError:
+            pass
+        return os.path.join(self.cfg['mc-directory'], level)
+
+    def world_locked(self):
+        """Whether or not the server holds the lock on its world.
+
+        Returns None if the lock can't be checked (missing world, or a server
+        version that doesn't lock the world at the file system level)."""
+        try:
+            fd = os.open(os.path.join(self.world_directory(), 'session.lock'), os.O_RDWR)
+        except OSError:
+            return None
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        else:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+            return None
+        finally:
+            os.close(fd)
+
+    async def _start(self):
+        self.queued.clear()
+        self.lifecycle = 'starting'
+        self.spawned = time.monotonic()
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.cfg['mc-command'].split(), cwd=self.cfg['mc-directory'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        lines = asyncio.Queue(self.cfg['console-buffer'])
+        self.client.loop.create_task(self.read_stream(self.proc.stdout, lines))
+        self.client.loop.create_task(self.read_stream(self.proc.stderr, lines))
+        self.client.loop.create_task(self.read_console(self.proc, lines))
+        self.supervisor.started(self.proc)
+
+    async def _stop(self):
+        if not self.running:
+            return
+        self.supervisor.stopping()
+        self.lifecycle = 'stopping'
+        self.console('stop')
+        try:
+            await asyncio.wait_for(self.proc.wait(), self.cfg['mc-kill-timeout'])
+        except asyncio.TimeoutError:
+            await self._kill()
+            return False
+        else:
+            return True
+        finally:
+            self.transport.close()
+
+    async def _kill(self):
+        if not self.running:
+            return False
+        self.supervisor.stopping()
+        self.lifecycle = 'stopping'
+        self.console('say Killing server!')
+        await asyncio.sleep(0.5)
+        self.proc.kill()
+        return True
+
+    async def start_server(self):
+        """Start the server."""
+        if self.pruning:
+            await self.send_error('Region files are being pruned, the server will start when it is done.')
+            return
+        await self._start()
+        await self.set_trigger('start', None)
+        m = await self.send_tag('control', emoji.TRIGGERS['control'], 'Server starting...')
+        if m is not None:
+            await self.client.add_reaction(m, emoji.CHAT_START)
+            await self.set_trigger('chat_init', m)
+
+    async def stop_server(self):
+        """Stop the server, kill it after a timeout.
+        Attempt to gracefully stop the server. After some time,
+        if the server hasn't stopped, the process will be killed."""
+        t = time.time()
+        success = await self._stop()
+        t = time.time() - t
+        if success:
+            await self.send('Server stopped in {time:.3f}s'.format(time=t))
+        else:
+            await self.send('Server timed out and was killed')
+        await self.set_trigger('control', None)
+        await self.set_trigger('chat', None)
+        await self.set_trigger('chat_init', None)
+
+    async def kill_server(self):
+        """Kill the server.
+        This may cause corruption or similar issues, use responsibly."""
+        if await self._kill():
+            await self.send('Server killed')
+
+    async def restart_server(self):
+        """Restart the server.
+        Attempt to exit the server gracefully, and restart it."""
+        if self.pruning:
+            await self.send_error('Region files are being pruned, the server will start when it is done.')
+            return
+        self.restarted = time.monotonic()
+        if self.cfg['restart-prewarm'] and self.world_locked():
+            await self.prewarm()
+        else:
+            await self.stop_server()
+        await self._start()
+        await self.send_tag('control', emoji.TRIGGERS['control'], 'Server restarting...')
+
+    async def prewarm(self):
+        """Stop the server, returning as soon as it released its world."""
+        old = self.proc
+        self.supervisor.stopping()
+        self.lifecycle = 'stopping'
+        self.console('stop')
+        deadline = time.monotonic() + self.cfg['mc-kill-timeout']
+        while old.returncode is None and self.world_locked():
+            if time.monotonic() > deadline:
+                await self._kill()
+                await old.wait()
+                break
+            await asyncio.sleep(0.1)
+        await self.send('World released in {time:.3f}s'.format(time=time.monotonic() - self.restarted))
+        self.transport.close()
+        await self.set_trigger('control', None)
+        await self.set_trigger('chat', None)
+        await self.set_trigger('chat_init', None)
+
+    async def set_chat(self, args):
+        """Enable/disable chat forwarding.
+        Use `chat true` or `chat false` to change modes."""
+        value = args if isinstance(args, bool) else args.lower() in ('yes', 'true', '1')
+        if self.chat == value:
+            return
+        self.chat = value
+        self.chat_last = None
+        if self.chat_message is not None:
+            await self.client.delete_message(self.chat_message)
+        await self.set_trigger('chat_init', None)
+        await self.set_trigger('chat', None)
+        tag = 'chat' if self.chat else 'chat_init'
+        self.chat_message = await self.send_tag(tag, emoji.TRIGGERS[tag], 'Chat enabled' if self.chat else 'Chat muted')
+        if not self.chat:
+            await self.shell_terminate_all(self.shell_chat)
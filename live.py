@@ -0,0 +1,100 @@
+"""Messages edited in place: a live view of the console, and paged outputs."""
+import discord
+import control
+import emoji
+import logs
+
+
+class Live:
+    """A pinned message showing the last console lines.
+
+    The message is refreshed on a timer rather than for every line, and
+    only edited when its content changed, so the number of requests to
+    Discord doesn't depend on how much the server writes."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.client = instance.client
+        self.message: discord.Message = None
+        self.content = None
+        self.seen = 0
+        self.timer = None
+        self.editing = False
+
+    def render(self):
+        return logs.format_lines(self.instance.history.tail(self.instance.cfg['live-lines']))
+
+    async def start(self):
+        if self.message is not None:
+            return
+        self.seen = self.instance.history.total
+        self.content = self.render()
+        self.message = await self.instance.send(self.content)
+        if self.message is None:  # Control socket request
+            return
+        try:
+            await self.client.pin_message(self.message)
+        except discord.HTTPException:  # Missing permission, the view works anyway
+            pass
+        self.timer = self.client.scheduler.every(self.instance.cfg['live-interval'], self.refresh)
+
+    async def stop(self):
+        if self.message is None:
+            return
+        self.client.scheduler.cancel(self.timer)
+        message, self.message = self.message, None
+        try:
+            await self.client.unpin_message(message)
+        except discord.HTTPException:
+            pass
+
+    async def refresh(self):
+        """Edit the message if lines were added since the last refresh."""
+        history = self.instance.history
+        if self.editing or self.message is None or history.total == self.seen:
+            return
+        self.editing = True
+        try:
+            self.seen = history.total
+            content = self.render()
+            if content != self.content:
+                self.message = await self.client.edit_message(self.message, self.instance.label(content))
+                self.content = content
+        except discord.NotFound:  # Deleted by someone
+            self.client.scheduler.cancel(self.timer)
+            self.message = None
+        finally:
+            self.editing = False
+
+
+class Pager:
+    """An output too long for one message, browsed with reactions.
+
+    Only the latest paged output has the buttons."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.pages = []
+        self.index = 0
+        self.message: discord.Message = None
+
+    def render(self):
+        return '{page}\nPage {index}/{count}'.format(page=self.pages[self.index], index=self.index + 1,
+                                                     count=len(self.pages))
+
+    async def show(self, pages, index=0):
+        """Send the pages, starting with one of them."""
+        if len(pages) == 1 or control.replies() is not None:
+            for page in pages:
+                await self.instance.send(page)
+            return
+        self.pages = pages
+        self.index = index % len(pages)
+        self.message = await self.instance.send_tag('page', emoji.TRIGGERS['page'], self.render())
+
+    async def turn(self, step):
+        index = max(0, min(len(self.pages) - 1, self.index + step))
+        if self.message is None or index == self.index:
+            return
+        self.index = index
+        self.message = await self.instance.client.edit_message(self.message, self.instance.label(self.render()))
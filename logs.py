@@ -0,0 +1,174 @@
+"""Keep recent console lines in memory and archive all of them on disk."""
+import collections
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from classifier import Line
+
+
+class History:
+    """Fixed-size buffer of the most recent console lines."""
+
+    def __init__(self, size):
+        self.lines = collections.deque(maxlen=size)
+        self.total = 0
+
+    def append(self, line: Line):
+        self.lines.append(line)
+        self.total += 1
+
+    def tail(self, count):
+        """Get the last lines."""
+        return list(self.lines)[-count:] if count > 0 else []
+
+    def grep(self, pattern, count):
+        """Get the last lines matching a regular expression."""
+        pattern = re.compile(pattern)
+        return [line for line in self.lines if pattern.search(line.text)][-count:]
+
+
+class Archive:
+    """Compressed log segments on disk, indexed by time.
+
+    The index stores the first and last timestamp of each segment,
+    so that a time range query only decompresses the segments it overlaps.
+    Methods of this class block, run them in an executor. Writes and queries
+    may run in different threads: segments are only removed once no query
+    is reading them."""
+
+    def __init__(self, directory, segment_size, segments):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segments = segments
+        self.index_path = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+        try:
+            self.index = json.load(open(self.index_path))
+        except FileNotFoundError:
+            self.index = {}
+        self.current = max(self.index, key=lambda name: self.index[name][0], default=None)
+        self.lock = threading.Lock()
+        self.readers = 0
+        self.removed = []
+
+    def write(self, lines):
+        """Append lines to the current segment, starting a new one if it is full."""
+        if not lines:
+            return
+        with self.lock:
+            self.append(lines)
+
+    def append(self, lines):
+        if self.current is None or self.index[self.current][2] >= self.segment_size:
+            self.rotate(lines[0].time)
+        data = ''.join('{time:.0f}\t{logger}\t{text}\n'.format(time=line.time, logger=line.logger, text=line.text)
+                       for line in lines).encode()
+        with gzip.open(os.path.join(self.directory, self.current), 'ab') as f:
+            f.write(data)
+        entry = self.index[self.current]
+        entry[1] = max(entry[1], lines[-1].time)
+        entry[2] += len(data)
+        self.save()
+
+    def rotate(self, timestamp):
+        """Start a new segment, removing the oldest ones."""
+        name = 'segment-{time:.0f}.log.gz'.format(time=timestamp)
+        n = 0
+        while name in self.index:
+            n += 1
+            name = 'segment-{time:.0f}-{n}.log.gz'.format(time=timestamp, n=n)
+        self.index[name] = [timestamp, timestamp, 0]
+        self.current = name
+        for old in sorted(self.index, key=lambda name: self.index[name][0])[:-self.segments]:
+            self.index.pop(old)
+            self.removed.append(old)
+        if not self.readers:
+            self.remove()
+
+    def remove(self):
+        """Delete the segments removed from the index."""
+        for name in self.removed:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        self.removed.clear()
+
+    def save(self):
+        """Atomically write the index."""
+        temp = self.index_path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp, self.index_path)
+
+    def query(self, start, end, pattern=None, limit=None):
+        """Get archived lines logged between two timestamps, only the last `limit` ones if given."""
+        pattern = re.compile(pattern) if pattern else None
+        lines = collections.deque(maxlen=limit)
+        with self.lock:
+            self.readers += 1
+            segments = sorted((entry[0], entry[1], name) for name, entry in self.index.items())
+        try:
+            self.read(segments, start, end, pattern, lines)
+        finally:
+            with self.lock:
+                self.readers -= 1
+                if not self.readers:
+                    self.remove()
+        return list(lines)
+
+    def read(self, segments, start, end, pattern, lines):
+        for first, last, name in segments:
+            if last < start or first > end:
+                continue
+            try:
+                with gzip.open(os.path.join(self.directory, name), 'rt', errors='replace') as f:
+                    for raw in f:
+                        timestamp, logger, text = raw.rstrip('\n').split('\t', 2)
+                        timestamp = float(timestamp)
+                        if start <= timestamp <= end and (pattern is None or pattern.search(text)):
+                            lines.append(Line(timestamp, logger, text))
+            except (EOFError, FileNotFoundError):  # Truncated or missing segment
+                continue
+
+
+def format_line(line: Line):
+    return '[{time}] [{logger}]: {text}'.format(time=time.strftime('%H:%M:%S', time.localtime(line.time)),
+                                                logger=line.logger, text=line.text.replace('`', "'"))
+
+
+def split_pages(texts, limit):
+    """Group lines of text into pages of at most `limit` characters, cutting longer lines."""
+    pages = [[]]
+    size = 0
+    for text in texts:
+        text = text[:limit]
+        if size + len(text) + 1 > limit and pages[-1]:
+            pages.append([])
+            size = 0
+        pages[-1].append(text)
+        size += len(text) + 1
+    return ['\n'.join(page) for page in pages]
+
+
+def format_pages(lines, limit=1900):
+    """Format lines in code blocks fitting in a message each, oldest first."""
+    if not lines:
+        return ['No lines found.']
+    return ['```\n' + page + '\n```' for page in split_pages(map(format_line, lines), limit)]
+
+
+def format_lines(lines, limit=1900):
+    """Format lines in a code block, keeping the most recent ones that fit in a message."""
+    out = []
+    size = 0
+    for line in reversed(lines):
+        text = format_line(line)
+        size += len(text) + 1
+        if size > limit:
+            break
+        out.append(text)
+    return '```\n' + '\n'.join(reversed(out)) + '\n```' if out else 'No lines found.'
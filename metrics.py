@@ -0,0 +1,140 @@
+"""Measure minecord itself and export the measures in the Prometheus format."""
+import asyncio
+import bisect
+import collections
+import os
+import time
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class Histogram:
+    """Latency histogram with fixed buckets."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """Estimate a percentile, as the upper bound of the bucket it falls in."""
+        target = self.count * p / 100
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return BUCKETS[-1]
+
+
+def labels(**kwargs):
+    return tuple(sorted(kwargs.items()))
+
+
+def format_labels(label_items, **extra):
+    items = list(label_items) + sorted(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join('{key}="{value}"'.format(key=key, value=str(value).replace('"', '\\"'))
+                          for key, value in items) + '}'
+
+
+class Metrics:
+    """Registry of counters and histograms.
+
+    When disabled, `start` returns None and every other method returns
+    immediately, so instrumented code only pays for a function call."""
+
+    def __init__(self, enabled, loop):
+        self.enabled = enabled
+        self.loop = loop
+        self.started = time.time()
+        self.counters = collections.defaultdict(int)
+        self.histograms = collections.defaultdict(Histogram)
+        if enabled:
+            self.loop.call_later(1, self.measure_lag, self.loop.time() + 1)
+
+    def start(self):
+        """Start timing something, pass the result to `observe`."""
+        return time.perf_counter() if self.enabled else None
+
+    def observe(self, name, start, **label_values):
+        """Record the time elapsed since `start`."""
+        if start is None:
+            return
+        self.histograms[name, labels(**label_values)].observe(time.perf_counter() - start)
+
+    def inc(self, name, value=1, **label_values):
+        if self.enabled:
+            self.counters[name, labels(**label_values)] += value
+
+    def measure_lag(self, expected):
+        """Measure how late the event loop runs a callback scheduled every second."""
+        now = self.loop.time()
+        self.histograms['event_loop_lag_seconds', ()].observe(max(0, now - expected))
+        self.loop.call_later(1, self.measure_lag, now + 1)
+
+    def export(self):
+        """Export all measures in the Prometheus text format."""
+        lines = []
+        for name in sorted(set(name for name, _ in self.counters)):
+            lines.append('# TYPE minecord_{name} counter'.format(name=name))
+            for (key, label_items), value in sorted(self.counters.items()):
+                if key == name:
+                    lines.append('minecord_{name}{labels} {value}'.format(
+                        name=name, labels=format_labels(label_items), value=value))
+        for name in sorted(set(name for name, _ in self.histograms)):
+            lines.append('# TYPE minecord_{name} histogram'.format(name=name))
+            for (key, label_items), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if key != name:
+                    continue
+                total = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    total += count
+                    lines.append('minecord_{name}_bucket{labels} {total}'.format(
+                        name=name, labels=format_labels(label_items, le='+Inf' if bound == BUCKETS[-1] else bound),
+                        total=total))
+                lines.append('minecord_{name}_sum{labels} {sum}'.format(
+                    name=name, labels=format_labels(label_items), sum=histogram.sum))
+                lines.append('minecord_{name}_count{labels} {count}'.format(
+                    name=name, labels=format_labels(label_items), count=histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """Atomically write the export to a file. This blocks, run it in an executor."""
+        temp = filename + '.tmp'
+        with open(temp, 'w') as f:
+            f.write(self.export())
+        os.replace(temp, filename)
+
+    async def serve(self, reader, writer):
+        """Answer an HTTP request with the export."""
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+            writer.close()
+            return
+        body = self.export().encode()
+        writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                     b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+        await writer.drain()
+        writer.close()
+
+    def summary(self):
+        """Summarize measures for humans."""
+        uptime = time.time() - self.started
+        lines = ['{:40} {:>8} {:>8} {:>8}'.format('latency', 'count', 'p50', 'p99')]
+        for (name, label_items), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            lines.append('{:40} {:>8} {:>7.0f}ms {:>7.0f}ms'.format(
+                name + format_labels(label_items), histogram.count,
+                histogram.percentile(50) * 1000, histogram.percentile(99) * 1000))
+        lines.append('')
+        lines.append('{:40} {:>8} {:>8}'.format('counter', 'total', 'per sec'))
+        for (name, label_items), value in sorted(self.counters.items()):
+            lines.append('{:40} {:>8} {:>8.2f}'.format(name + format_labels(label_items), value, value / uptime))
+        return '\n'.join(lines)
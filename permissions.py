@@ -1,111 +1,214 @@
 """Handle roles and permissions."""
-import json
 import re
+import control
+from storage import load_json, mtime, write_json
 
 
 class Role:
     """Define a role, with permissions and sub-roles."""
 
-    def __init__(self, name='', all_perms=set()):
+    def __init__(self, name='', all_perms=None):
         self.name = name
-        self.all_perms = all_perms
+        self.all_perms = set() if all_perms is None else all_perms
         self.perms = []
         self.sub_roles = []
+        self.effective = None
+        self.wildcard = False
+        self.shells = frozenset()
 
-    def load(self, perm_list, permissions):
+    def load(self, perm_list, roles):
         """Load from a permission list."""
         for perm in perm_list:
             if perm.startswith('#'):
-                self.sub_roles.append(permissions.get_role(perm[1:]))
+                self.sub_roles.append(roles.get(perm[1:], Role()))
             else:
                 self.perms.append(perm)
         self.all_perms.update(self.perms)
 
+    def compile(self, path=()):
+        """Flatten permissions from all sub-roles into a single set.
+
+        Raises ValueError if roles reference each other in a cycle."""
+        if self.name in path:
+            raise ValueError('Cyclic role reference: ' + ' -> '.join('#' + name for name in path + (self.name,)))
+        if self.effective is not None:
+            return
+        effective = set(self.perms)
+        effective.add('#' + self.name)
+        for role in self.sub_roles:
+            role.compile(path + (self.name,))
+            effective.update(role.effective)
+        self.effective = frozenset(effective)
+        self.wildcard = '@' in self.effective
+        self.shells = frozenset(perm for perm in self.effective if perm.startswith('$'))
+
     def __contains__(self, item):
         """Whether or not a permission/role is contained."""
-        if item == '#' + self.name:
-            return True
-        contain = item in self.perms or any([item in role for role in self.sub_roles])
-        if contain:
+        if item in self.effective:
             return True
-        if item == '@' or any([item.startswith(pre) for pre in ('#', '$')]):
+        if not self.wildcard or item == '@' or item.startswith(('#', '$')):
             return False
-        if item not in self.all_perms:
-            return '@' in self
+        return item not in self.all_perms
 
     def __bool__(self):
         """Whether or not this role has any permissions."""
-        return len(self.perms) > 0 or any(self.sub_roles)
+        return any(not perm.startswith('#') for perm in self.effective)
+
+
+def dependents(data, changed):
+    """Names of the roles which are, or include, one of the changed roles."""
+    including = {}
+    for name, perm_list in data.items():
+        for perm in perm_list:
+            if perm.startswith('#'):
+                including.setdefault(perm[1:], set()).add(name)
+    result = set()
+    stack = list(changed)
+    while stack:
+        name = stack.pop()
+        if name not in result:
+            result.add(name)
+            stack.extend(including.get(name, ()))
+    return result
 
 
 class Permissions:
-    """Handle permissions."""
+    """Handle permissions.
+
+    Role changes are saved in the background, a few seconds after the last
+    one. The files are checked for changes regularly and reloaded."""
     def __init__(self, roles_filename, users_filename, client):
         self.roles_filename = roles_filename
         self.users_filename = users_filename
         self.client = client
         self.all_perms = set()
+        self.data = {}
         self.roles = {}
         self.users = {}
+        self.cache = {}
+        self.dirty = {}
+        self.save_timer = None
+        self.mtimes = (None, None)
+        self.nobody = Role()
+        self.nobody.compile()
         self.reload()
+        if client.cfg['role-watch-interval'] > 0:
+            client.scheduler.every(client.cfg['role-watch-interval'], self.watch)
 
     def __getitem__(self, item):
         """Get a user's role."""
-        if item not in self.users:
-            return Role()
-        else:
-            return self.get_role(self.users[item])
+        role = self.cache.get(item)
+        if role is None:
+            role = self.cache[item] = self.get_role(self.users[item]) if item in self.users else self.nobody
+        return role
 
     def reload(self):
-        """Reload roles and users."""
-        self.all_perms.clear()
-        self.roles.clear()
-        data = json.load(open(self.roles_filename))
-        for role in data:
-            self.roles[role] = Role(role, self.all_perms)
-        for name, role in self.roles.items():
-            role.load(data[name], self)
-        if '@' in self.all_perms:
-            self.all_perms.remove('@')
-        self.reload_users()
-
-    def reload_users(self):
-        """Reload users."""
-        self.users.clear()
-        data = json.load(open(self.users_filename))
-        self.users.update(data)
+        """Reload roles and users.
+
+        Roles are only replaced once they all compiled successfully."""
+        self.mtimes = (mtime(self.roles_filename), mtime(self.users_filename))
+        self.load_roles(load_json(self.roles_filename))
+        self.load_users(load_json(self.users_filename))
+
+    def load_roles(self, data):
+        """Replace the roles, only compiling again the ones that changed or include a changed role."""
+        changed = set(name for name in data.keys() | self.data.keys() if data.get(name) != self.data.get(name))
+        affected = dependents(data, changed)
+        all_perms = set(perm for perm_list in data.values() for perm in perm_list if not perm.startswith('#'))
+        all_perms.discard('@')
+        roles = {name: role for name, role in self.roles.items() if name in data and name not in affected}
+        for name in affected & data.keys():
+            roles[name] = Role(name, all_perms)
+        for name in affected & data.keys():
+            roles[name].load(data[name], roles)
+        for name in affected & data.keys():
+            roles[name].compile()
+        for role in roles.values():
+            role.all_perms = all_perms
+        self.data, self.all_perms, self.roles = data, all_perms, roles
+        if affected:
+            self.cache.clear()
+
+    def load_users(self, data):
+        """Replace the users, keeping role changes which aren't saved yet."""
+        for uid, role in self.dirty.items():
+            if role is None:
+                data.pop(uid, None)
+            else:
+                data[uid] = role
+        for uid in self.users.keys() | data.keys():
+            if self.users.get(uid) != data.get(uid):
+                self.cache.pop(uid, None)
+        self.users = data
+
+    async def watch(self):
+        """Reload the files which changed since they were last loaded."""
+        roles_mtime, users_mtime = mtime(self.roles_filename), mtime(self.users_filename)
+        loop = self.client.loop
+        try:
+            if roles_mtime != self.mtimes[0]:
+                self.mtimes = (roles_mtime, self.mtimes[1])
+                self.load_roles(await loop.run_in_executor(None, load_json, self.roles_filename))
+            if users_mtime != self.mtimes[1]:
+                self.mtimes = (self.mtimes[0], users_mtime)
+                self.load_users(await loop.run_in_executor(None, load_json, self.users_filename))
+        except (OSError, ValueError) as e:  # Invalid JSON, or a cycle between roles
+            print('Permission settings were not reloaded: {error}'.format(error=e))
+
+    async def save(self):
+        """Write the users file, with every role change made since the last save."""
+        self.save_timer = None
+        dirty, self.dirty = self.dirty, {}
+        try:
+            users_mtime = await self.client.loop.run_in_executor(None, write_json, self.users_filename,
+                                                                 dict(self.users))
+        except OSError as e:
+            dirty.update(self.dirty)
+            self.dirty = dirty  # Keep the changes for the next save
+            print('Role assignations were not saved: {error}'.format(error=e))
+            if self.save_timer is None:
+                self.save_timer = self.client.scheduler.call_later(self.client.cfg['role-save-delay'], self.save)
+            return
+        self.mtimes = (self.mtimes[0], users_mtime)
+
+    async def flush(self):
+        """Save role changes right away, instead of waiting for the timer."""
+        self.client.scheduler.cancel(self.save_timer)
+        self.save_timer = None
+        if self.dirty:
+            await self.save()
 
     def get_role(self, name):
-        return self.roles.get(name, Role())
+        return self.roles.get(name, self.nobody)
 
-    async def list_roles(self, args):
+    async def list_roles(self, args, instance):
         """List different roles, or list the permissions of a role.
         Using `rlist Role` will display info about this role."""
         if not args:
-            await self.client.send("The following roles exist: " + ', '.join(['#**%s**' % name for name in self.roles]))
+            await instance.send("The following roles exist: " + ', '.join(['#**%s**' % name for name in self.roles]))
         else:
             args = args.lstrip('#')
             if args not in self.roles:
-                await self.client.send_error("Role #**{role}** doesn't exist.".format(role=args))
+                await instance.send_error("Role #**{role}** doesn't exist.".format(role=args))
             else:
                 role = self.roles[args]
                 message = "Role #**{role}** has the following permissions: ".format(role=args) + ', '.join(role.perms)
                 for sub_role in role.sub_roles:
                     message += ' + #**{sub}**'.format(sub=sub_role.name)
-                await self.client.send(message)
+                await instance.send(message)
 
-    async def show_role(self, args):
+    async def show_role(self, args, instance):
         """Display someone's role.
         Either a mention or a User ID can be used."""
         uid = get_uid(args)
         if uid is None:
             return
         if uid not in self.users:
-            await self.client.send('This user has no roles.')
+            await instance.send('This user has no roles.')
         else:
-            await self.client.send('This user has the #**{role}** role.'.format(role=self.users[uid]))
+            await instance.send('This user has the #**{role}** role.'.format(role=self.users[uid]))
 
-    async def set_role(self, args, user):
+    async def set_role(self, args, user, instance):
         """Set or remove someone's role.
         Either a mention or a User ID can be used.
         To remove a role, just use `rset @user`."""
@@ -114,24 +217,30 @@ class Permissions:
             new_role = new_role.lstrip('#')
         else:
             target, new_role = args, None
-        user_role = self.users[user.id]
+        user_role = user.role if isinstance(user, control.Caller) else self.users.get(user.id)
+        if user_role is None:
+            await instance.send_error_perms(user.mention + ", you don't have a role.")
+            return
         target = get_uid(target)
         old_role = self.users.get(target, None)
         if old_role is not None and (old_role == user_role or '#' + old_role not in self.get_role(user_role)):
-            await self.client.send_error_perms(user.mention + ", you aren't allowed to remove this role.")
+            await instance.send_error_perms(user.mention + ", you aren't allowed to remove this role.")
             return
         if new_role is not None and (new_role == user_role or '#' + new_role not in self.get_role(user_role)):
-            await self.client.send_error_perms(user.mention + ", you aren't allowed to assign this role.")
+            await instance.send_error_perms(user.mention + ", you aren't allowed to assign this role.")
             return
         if new_role is None and target in self.users:
             self.users.pop(target)
         else:
             self.users[target] = new_role
-        json.dump(self.users, open(self.users_filename, 'w'), indent=2)
+        self.cache.pop(target, None)
+        self.dirty[target] = new_role
+        if self.save_timer is None:
+            self.save_timer = self.client.scheduler.call_later(self.client.cfg['role-save-delay'], self.save)
         if new_role is None:
-            await self.client.send("Role successfully removed.")
+            await instance.send("Role successfully removed.")
         else:
-            await self.client.send("Role #**{role}** successfully assigned.".format(role=new_role))
+            await instance.send("Role #**{role}** successfully assigned.".format(role=new_role))
 
 
 def get_uid(args):
@@ -0,0 +1,131 @@
+"""Track players and their sessions from console events."""
+import asyncio
+import re
+import sqlite3
+import time
+import sender
+
+# One pattern for every player event, so they cost a single match per line
+EVENT = re.compile(r'([A-Za-z0-9_]{1,16}) (?:(joined the game)|(left the game)|(?P<death>'
+                   r'was |drowned|died|fell |hit the ground|blew up|burned to death|went up in flames|'
+                   r'tried to swim in lava|suffocated|starved to death|withered away|froze to death|'
+                   r'experienced kinetic energy|discovered the floor was lava|walked into|didn\'t want to live))')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (name TEXT PRIMARY KEY, first_seen REAL, last_seen REAL,
+                                    playtime REAL, sessions INTEGER, deaths INTEGER);
+CREATE TABLE IF NOT EXISTS sessions (name TEXT, joined REAL, left REAL);
+'''
+
+
+class Player:
+    """Statistics of one player."""
+
+    __slots__ = ('name', 'first_seen', 'last_seen', 'playtime', 'sessions', 'deaths')
+
+    def __init__(self, name, first_seen=0, last_seen=0, playtime=0, sessions=0, deaths=0):
+        self.name = name
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.playtime = playtime
+        self.sessions = sessions
+        self.deaths = deaths
+
+    def row(self):
+        return self.name, self.first_seen, self.last_seen, self.playtime, self.sessions, self.deaths
+
+
+class Players:
+    """In-memory index of players, persisted to SQLite in batches.
+
+    Every query is answered from memory; changes are written by a
+    background flush, in one transaction per batch."""
+
+    def __init__(self, instance, path, flush):
+        self.instance = instance
+        self.db = sqlite3.connect(path, check_same_thread=False)  # Only used by one flush at a time
+        self.db.executescript(SCHEMA)
+        self.players = {row[0]: Player(*row) for row in self.db.execute('SELECT * FROM players')}
+        self.online = {}
+        self.pending = sender.Coalescer(self.flush, flush, float('inf'), instance.client.loop)
+        self.lock = asyncio.Lock()  # Writes don't overlap, and don't happen after the database is closed
+        self.closed = False
+        instance.classifier.register(self.on_event, '', EVENT, logger='Server thread/INFO')
+
+    def get(self, name, now):
+        player = self.players.get(name)
+        if player is None:
+            player = self.players[name] = Player(name, first_seen=now)
+        return player
+
+    async def on_event(self, line, match):
+        name, joined, left = match.group(1, 2, 3)
+        now = time.time()
+        if joined:
+            self.join(name, now)
+        elif name in self.online:  # Death and leave messages must be about someone online
+            if left:
+                self.leave(name, now)
+            else:
+                player = self.get(name, now)
+                player.deaths += 1
+                self.pending.push(('player', name))
+
+    def join(self, name, now):
+        if name in self.online:
+            self.leave(name, now)
+        player = self.get(name, now)
+        player.last_seen = now
+        player.sessions += 1
+        self.online[name] = now
+        self.pending.push(('player', name))
+
+    def leave(self, name, now):
+        joined = self.online.pop(name)
+        player = self.get(name, now)
+        player.last_seen = now
+        player.playtime += now - joined
+        self.pending.push(('player', name))
+        self.pending.push(('session', name, joined, now))
+
+    def leave_all(self):
+        """End every session, when the server process exits."""
+        now = time.time()
+        for name in list(self.online):
+            self.leave(name, now)
+
+    def playtime(self, name):
+        """Total play time of a player, including the current session."""
+        player = self.players[name]
+        return player.playtime + (time.time() - self.online[name] if name in self.online else 0)
+
+    async def flush(self, events):
+        async with self.lock:
+            if not self.closed:
+                await self.write_events(events)
+
+    async def write_events(self, events):
+        players = set()
+        sessions = []
+        for event in events:
+            if event[0] == 'player':
+                players.add(event[1])
+            else:
+                sessions.append(event[1:])
+        rows = [self.players[name].row() for name in players]
+        await self.instance.client.loop.run_in_executor(None, self.write, rows, sessions)
+
+    async def close(self):
+        """End every session and write the pending changes, when minecord exits."""
+        self.leave_all()
+        events = list(self.pending.lines)
+        self.pending.lines.clear()
+        await self.flush(events)
+        async with self.lock:
+            self.closed = True
+            self.db.close()
+
+    def write(self, rows, sessions):
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.db.executemany('INSERT INTO sessions VALUES (?, ?, ?)', sessions)
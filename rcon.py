@@ -0,0 +1,141 @@
+"""Asynchronous client for the Minecraft RCON protocol."""
+import asyncio
+import itertools
+import struct
+import time
+from console import Response
+
+LOGIN = 3
+COMMAND = 2
+RESPONSE = 0
+MAX_PAYLOAD = 4096  # Longer responses are split into several packets
+
+
+class RconError(Exception):
+    """Raised when a command can't go through the RCON connection."""
+
+
+def pack(request_id, kind, body: str):
+    """Build a packet."""
+    payload = struct.pack('<ii', request_id, kind) + body.encode() + b'\x00\x00'
+    return struct.pack('<i', len(payload)) + payload
+
+
+async def read_packet(reader: asyncio.StreamReader):
+    """Read a packet, return its request id, type and raw body."""
+    length, = struct.unpack('<i', await reader.readexactly(4))
+    data = await reader.readexactly(length)
+    request_id, kind = struct.unpack('<ii', data[:8])
+    return request_id, kind, data[8:-2]
+
+
+class Rcon:
+    """Persistent RCON connection, with several commands in flight.
+
+    Responses are matched to their command by request id. Each command is
+    followed by an empty packet of an invalid type, which the server answers
+    after the whole response, so responses split into several packets are
+    complete when the answer to that marker arrives. The connection is
+    opened on the first command and reopened after it is lost."""
+
+    def __init__(self, host, port, password, loop, timeout=10, max_backoff=30):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.loop = loop
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.backoff = 0
+        self.retry_at = 0
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.markers = {}
+        self.writer: asyncio.StreamWriter = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        """Open and authenticate the connection if needed."""
+        async with self.lock:
+            if self.connected:
+                return
+            if time.monotonic() < self.retry_at:
+                raise RconError('RCON unavailable, retrying in {time:.0f}s'.format(time=self.retry_at - time.monotonic()))
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                writer.write(pack(next(self.ids), LOGIN, self.password))
+                request_id, kind, body = await asyncio.wait_for(read_packet(reader), self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.backoff = min(self.max_backoff, self.backoff * 2 or 1)
+                self.retry_at = time.monotonic() + self.backoff
+                raise RconError('Could not connect to RCON: {error}'.format(error=str(e) or type(e).__name__))
+            if request_id == -1:
+                writer.close()
+                raise RconError('RCON authentication failed')
+            self.backoff = 0
+            self.writer = writer
+            self.loop.create_task(self.read_loop(reader, writer))
+
+    def close(self, error=None):
+        """Close the connection, failing commands waiting for a response."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        for future, chunks in self.pending.values():
+            if not future.done():
+                future.set_exception(error or RconError('RCON connection closed'))
+        self.pending.clear()
+        self.markers.clear()
+
+    async def read_loop(self, reader, writer):
+        try:
+            while True:
+                request_id, kind, body = await read_packet(reader)
+                if request_id in self.markers:  # The response of the previous command is complete
+                    entry = self.pending.pop(self.markers.pop(request_id), None)
+                    if entry is not None and not entry[0].done():
+                        entry[0].set_result(b''.join(entry[1]).decode(errors='replace'))
+                elif request_id in self.pending:
+                    self.pending[request_id][1].append(body)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        if self.writer is writer:
+            self.close(RconError('RCON connection lost'))
+
+    async def command(self, message):
+        """Run a command and return its response."""
+        await self.connect()
+        request_id, marker = next(self.ids), next(self.ids)
+        future = self.loop.create_future()
+        self.pending[request_id] = (future, [])
+        self.markers[marker] = request_id
+        self.writer.write(pack(request_id, COMMAND, message) + pack(marker, RESPONSE, ''))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise RconError('No response from RCON for `{command}`'.format(command=message))
+        finally:
+            self.pending.pop(request_id, None)
+            self.markers.pop(marker, None)
+
+    async def request(self, *messages):
+        """Run commands and time their responses.
+
+        The commands are written in the same iteration of the event loop,
+        so their packets leave in as few segments as possible."""
+        sent = time.monotonic()
+        texts = await asyncio.gather(*[self.command(message) for message in messages])
+        return Response(list(messages), '\n'.join(text for text in texts if text), time.monotonic() - sent)
+
+    def send(self, message):
+        """Run a command without waiting for its response."""
+        self.loop.create_task(self.run(message))
+
+    async def run(self, message):
+        try:
+            await self.command(message)
+        except RconError:
+            pass
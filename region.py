@@ -0,0 +1,143 @@
+"""Analyze and prune region files (.mca) of a Minecraft world.
+
+A region file starts with a table of 1024 chunk locations (offset and
+length in 4 KiB sectors) followed by 1024 modification timestamps.
+Files are memory-mapped so only the header and the chunks are read."""
+import collections
+import concurrent.futures
+import gzip
+import mmap
+import os
+import zlib
+
+SECTOR = 4096
+HEADER = 2 * SECTOR
+# TAG_Long named InhabitedTime: tag type, name length, name, then the value
+INHABITED = b'\x04\x00\x0dInhabitedTime'
+
+Stats = collections.namedtuple('Stats', 'dimension files chunks stale size')
+
+
+def locations(mm):
+    """Yield (index, offset, sectors) for each chunk present in a region file."""
+    for index in range(1024):
+        entry = int.from_bytes(mm[index * 4:index * 4 + 4], 'big')
+        offset, sectors = entry >> 8, entry & 0xFF
+        if offset >= 2 and sectors:
+            yield index, offset, sectors
+
+
+def inhabited_time(mm, offset):
+    """Read the InhabitedTime of a chunk, in ticks. Returns None if it can't be read."""
+    start = offset * SECTOR
+    length = int.from_bytes(mm[start:start + 4], 'big')
+    kind = mm[start + 4]
+    data = mm[start + 5:start + 4 + length]
+    try:
+        if kind == 1:
+            data = gzip.decompress(data)
+        elif kind == 2:
+            data = zlib.decompress(data)
+        elif kind != 3:  # External or unknown compression
+            return None
+    except (OSError, zlib.error, EOFError):
+        return None
+    index = data.find(INHABITED)
+    if index < 0:
+        return None
+    index += len(INHABITED)
+    return int.from_bytes(data[index:index + 8], 'big', signed=True)
+
+
+def is_stale(mm, offset, stale_ticks):
+    ticks = inhabited_time(mm, offset)
+    return ticks is not None and ticks < stale_ticks
+
+
+def analyze_file(path, stale_ticks):
+    """Count chunks and stale chunks of a region file. Runs in a worker process."""
+    size = os.path.getsize(path)
+    if size < HEADER:
+        return 0, 0, size
+    chunks = stale = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for index, offset, sectors in locations(mm):
+            chunks += 1
+            if (offset + sectors) * SECTOR <= size and is_stale(mm, offset, stale_ticks):
+                stale += 1
+    return chunks, stale, size
+
+
+def prune_file(path, stale_ticks):
+    """Rewrite a region file without its stale chunks. Runs in a worker process.
+
+    Returns the number of chunks removed and the number of bytes freed."""
+    size = os.path.getsize(path)
+    if size < HEADER:
+        return 0, 0
+    kept = []
+    removed = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for index, offset, sectors in locations(mm):
+            if (offset + sectors) * SECTOR > size:
+                continue  # Truncated chunk, the server would discard it anyway
+            if is_stale(mm, offset, stale_ticks):
+                removed += 1
+                continue
+            timestamp = mm[SECTOR + index * 4:SECTOR + index * 4 + 4]
+            kept.append((index, sectors, timestamp, mm[offset * SECTOR:(offset + sectors) * SECTOR]))
+    if not removed:
+        return 0, 0
+    if not kept:
+        os.remove(path)
+        return removed, size
+    header = bytearray(HEADER)
+    body = []
+    offset = 2
+    for index, sectors, timestamp, data in kept:
+        header[index * 4:index * 4 + 4] = ((offset << 8) | sectors).to_bytes(4, 'big')
+        header[SECTOR + index * 4:SECTOR + index * 4 + 4] = timestamp
+        body.append(data)
+        offset += sectors
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(header)
+        for data in body:
+            f.write(data)
+    os.replace(temp, path)
+    return removed, size - offset * SECTOR
+
+
+def region_files(world):
+    """Find region files, grouped by dimension."""
+    dimensions = collections.defaultdict(list)
+    for directory, dirs, names in os.walk(world):
+        if os.path.basename(directory) != 'region':
+            continue
+        dimension = os.path.relpath(os.path.dirname(directory), world)
+        dimension = 'overworld' if dimension == '.' else dimension
+        dimensions[dimension].extend(os.path.join(directory, name) for name in names if name.endswith('.mca'))
+    return dimensions
+
+
+def analyze(world, stale_ticks, workers):
+    """Analyze every region file of a world in parallel, return Stats for each dimension.
+
+    This blocks, run it in an executor."""
+    stats = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        for dimension, files in sorted(region_files(world).items()):
+            results = list(pool.map(analyze_file, files, [stale_ticks] * len(files), chunksize=16))
+            stats.append(Stats(dimension, len(files), sum(r[0] for r in results), sum(r[1] for r in results),
+                               sum(r[2] for r in results)))
+    return stats
+
+
+def prune(world, stale_ticks, workers):
+    """Remove stale chunks from every region file of a world, in parallel.
+
+    The server must not be running. This blocks, run it in an executor."""
+    files = [path for paths in region_files(world).values() for path in paths]
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(prune_file, files, [stale_ticks] * len(files), chunksize=16))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
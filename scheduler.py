@@ -0,0 +1,104 @@
+"""Run delayed and recurring callbacks from a single timer."""
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+
+
+class Timer:
+    """A scheduled callback."""
+
+    def __init__(self, when, interval, func, args):
+        self.when = when
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+
+class Scheduler:
+    """Keep timers in a heap, with one event loop callback armed for the earliest.
+
+    Cancelled timers stay in the heap until they are due or until they
+    outnumber the live ones, at which point the heap is rebuilt."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.heap = []
+        self.counter = itertools.count()
+        self.cancelled = 0
+        self.handle: asyncio.TimerHandle = None
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def call_later(self, delay, func, *args):
+        """Call func(*args) after a delay. Coroutine functions are run as tasks."""
+        return self.push(Timer(self.loop.time() + delay, None, func, args))
+
+    def every(self, interval, func, *args, delay=None):
+        """Call func(*args) every interval, starting after delay (or interval)."""
+        return self.push(Timer(self.loop.time() + (interval if delay is None else delay), interval, func, args))
+
+    def daily(self, hour, minute, func, *args):
+        """Call func(*args) every day at a given local time."""
+        now = time.localtime()
+        delay = (hour - now.tm_hour) * 3600 + (minute - now.tm_min) * 60 - now.tm_sec
+        return self.every(86400, func, *args, delay=delay % 86400)
+
+    def cancel(self, timer: Timer):
+        if timer is None or timer.cancelled:
+            return
+        timer.cancelled = True
+        self.cancelled += 1
+        if self.cancelled > len(self.heap) // 2:
+            self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled = 0
+            self.arm()
+
+    def push(self, timer: Timer):
+        heapq.heappush(self.heap, (timer.when, next(self.counter), timer))
+        if self.heap[0][2] is timer:
+            self.arm()
+        return timer
+
+    def arm(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.heap:
+            self.handle = self.loop.call_at(self.heap[0][0], self.fire)
+
+    def fire(self):
+        self.handle = None
+        now = self.loop.time()
+        while self.heap and self.heap[0][0] <= now:
+            when, _, timer = heapq.heappop(self.heap)
+            if timer.cancelled:
+                self.cancelled -= 1
+                continue
+            if timer.interval is not None:
+                timer.when = when + timer.interval
+                heapq.heappush(self.heap, (timer.when, next(self.counter), timer))
+            else:
+                timer.cancelled = True  # Cancelling a timer that already ran does nothing
+            self.run(timer)
+        self.arm()
+
+    def run(self, timer: Timer):
+        try:
+            result = timer.func(*timer.args)
+        except Exception:
+            traceback.print_exc()
+            return
+        if asyncio.iscoroutine(result):
+            self.loop.create_task(self.wait(result))
+
+    @staticmethod
+    async def wait(coro):
+        try:
+            await coro
+        except Exception:
+            traceback.print_exc()
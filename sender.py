@@ -0,0 +1,120 @@
+"""Pace outgoing Discord requests and coalesce bursts of messages."""
+import asyncio
+import collections
+import time
+
+# Requests allowed per route, as (requests, seconds), for each channel
+ROUTES = {
+    'send': (5, 5),
+    'edit': (5, 5),
+    'delete': (5, 1),
+    'get': (5, 1),
+    'react': (1, 0.25),
+    'pin': (5, 5),
+}
+
+
+class Bucket:
+    """Token bucket allowing a number of requests over a period of time."""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request can be made."""
+        self.waiting += 1
+        try:
+            async with self.lock:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+        finally:
+            self.waiting -= 1
+
+
+class Sender:
+    """Keep track of the rate limit buckets of every route."""
+
+    def __init__(self, routes=None):
+        self.routes = routes or ROUTES
+        self.buckets = {}
+        self.requests = collections.Counter()
+
+    async def acquire(self, route, channel_id):
+        """Wait for the bucket of a route, for a given channel."""
+        key = (route, channel_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(*self.routes[route])
+        await bucket.acquire()
+        self.requests[route] += 1
+
+    @property
+    def waiting(self):
+        """Number of requests waiting for their bucket."""
+        return sum(bucket.waiting for bucket in self.buckets.values())
+
+
+class Coalescer:
+    """Buffer lines and hand them over in batches after a flush window.
+
+    With `batch`, the buffer is also flushed as soon as it holds that many
+    lines, so that a burst is written rather than dropped."""
+
+    def __init__(self, flush, window, size, loop, batch=None):
+        self.flush = flush
+        self.window = window
+        self.lines = collections.deque()
+        self.size = size
+        self.loop = loop
+        self.batch = batch
+        self.full = asyncio.Event()
+        self.task = None
+        self.dropped = 0
+        self.flushes = 0
+
+    def push(self, line):
+        """Add a line, dropping the oldest one if the buffer is full. Returns True if a line was dropped."""
+        dropped = len(self.lines) >= self.size
+        if dropped:
+            self.lines.popleft()
+            self.dropped += 1
+        self.lines.append(line)
+        if self.batch is not None and len(self.lines) >= self.batch:
+            self.full.set()
+        if self.task is None:
+            self.task = self.loop.create_task(self.run())
+        return dropped
+
+    async def wait(self):
+        if self.batch is None:
+            await asyncio.sleep(self.window)
+            return
+        if len(self.lines) >= self.batch:
+            return
+        self.full.clear()
+        try:
+            await asyncio.wait_for(self.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        try:
+            while self.lines:
+                await self.wait()
+                lines = list(self.lines)
+                self.lines.clear()
+                self.flushes += 1
+                await self.flush(lines)
+        finally:
+            self.task = None
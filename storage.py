@@ -0,0 +1,26 @@
+"""Read and write the JSON files kept by minecord."""
+import json
+import os
+
+
+def mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_json(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def write_json(filename, data):
+    """Atomically replace a JSON file. This blocks, run it in an executor.
+
+    Returns the modification time of the new file."""
+    temp = filename + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp, filename)
+    return mtime(filename)
@@ -0,0 +1,152 @@
+"""Detect crashed or hung servers and restart them."""
+import asyncio
+import collections
+import time
+import console
+import rcon
+
+# Cheap command used to check that the server responds, and the start of its output
+PROBE = 'list'
+PROBE_RESPONSE = 'There are '
+# Output of `/stop`, run from the server console, or by a player or an RCON client
+STOPPING = 'Stopping the server'
+STOPPING_BY = r'\[[^\s:]+: Stopping the server\]$'
+
+
+class Supervisor:
+    """Watch the process of an instance, restart it when it crashes or hangs.
+
+    Restarts are delayed with an exponential backoff, and stop altogether
+    when the server fails too many times in a row."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.cfg = instance.cfg
+        self.expected = False
+        self.outside = False  # Stopped with a command minecord didn't send
+        self.failures = collections.deque()
+        self.incidents = collections.deque(maxlen=10)
+        self.incident: dict = None
+        self.probe_timer = None
+        self.probing = False
+        self.last_alive = 0
+        self.alive = asyncio.Event()
+        instance.classifier.register(self.on_probe, PROBE_RESPONSE)
+        instance.classifier.register(self.on_stopping, STOPPING)
+        instance.classifier.register(self.on_stopping, '[', STOPPING_BY)
+
+    @property
+    def scheduler(self):
+        return self.instance.client.scheduler
+
+    def started(self, proc):
+        """Start watching a new process."""
+        self.expected = False
+        self.outside = False
+        self.last_alive = time.monotonic()
+        self.instance.client.loop.create_task(self.watch(proc))
+        self.scheduler.cancel(self.probe_timer)
+        if self.cfg['watchdog-interval'] > 0:
+            self.probe_timer = self.scheduler.every(self.cfg['watchdog-interval'], self.probe,
+                                                    delay=self.cfg['watchdog-grace'])
+
+    async def ready(self):
+        """The server finished starting, check it regularly from now on."""
+        self.last_alive = time.monotonic()
+        self.scheduler.cancel(self.probe_timer)
+        if self.cfg['watchdog-interval'] > 0:
+            self.probe_timer = self.scheduler.every(self.cfg['watchdog-interval'], self.probe)
+        incident = self.incident
+        if incident is not None:
+            incident['recover'] = time.monotonic() - incident['start']
+            self.incident = None
+            await self.instance.send('Server recovered in {recover:.1f}s (detected in {detect:.1f}s).'.format(
+                **incident))
+
+    def stopping(self):
+        """Expect the process to exit."""
+        self.expected = True
+        self.scheduler.cancel(self.probe_timer)
+        self.probe_timer = None
+
+    async def watch(self, proc):
+        code = await proc.wait()
+        if self.expected and not self.outside or proc is not self.instance.proc:
+            return
+        self.stopping()
+        if self.outside or code == 0:  # Stopped on purpose, not restarted
+            await self.instance.send('Server stopped outside of minecord (code {code}).'.format(code=code))
+            for tag in ('control', 'chat', 'chat_init'):
+                await self.instance.set_trigger(tag, None)
+            return
+        await self.failed('crash', 0, 'Server exited unexpectedly (code {code}).'.format(code=code))
+
+    async def ping(self):
+        if isinstance(self.instance.transport, console.Stdin):
+            self.alive.clear()
+            self.instance.transport.send(PROBE)  # Not queued while the server is starting
+            await self.alive.wait()
+        else:
+            await self.instance.transport.command(PROBE)
+
+    async def probe(self):
+        """Check that the server responds to a command, kill it otherwise."""
+        proc = self.instance.proc
+        if self.probing or self.expected or not self.instance.running:
+            return
+        self.probing = True
+        try:
+            await asyncio.wait_for(self.ping(), self.cfg['watchdog-timeout'])
+        except (asyncio.TimeoutError, rcon.RconError):
+            if self.expected or proc is not self.instance.proc or not self.instance.running:
+                return
+            detect = time.monotonic() - self.last_alive
+            self.stopping()
+            proc.kill()
+            await self.failed('hang', detect, 'Server did not respond for {time:.0f}s and was killed.'.format(
+                time=detect))
+        else:
+            self.last_alive = time.monotonic()
+        finally:
+            self.probing = False
+
+    async def on_probe(self, line, match):
+        self.alive.set()
+
+    async def on_stopping(self, line, match):
+        if not self.expected:  # Not stopped by minecord
+            self.outside = True
+            self.stopping()
+
+    async def failed(self, kind, detect, message):
+        """Record a failure and schedule a restart."""
+        now = time.monotonic()
+        self.incident = {'kind': kind, 'time': time.time(), 'start': now, 'detect': detect, 'recover': None}
+        self.incidents.append(self.incident)
+        self.failures.append(now)
+        while self.failures[0] < now - self.cfg['crash-loop-window']:
+            self.failures.popleft()
+        if len(self.failures) > self.cfg['crash-loop-count']:
+            self.failures.clear()
+            await self.instance.send_error(message + ' The server failed too often and will not be restarted.')
+            return
+        delay = min(self.cfg['restart-max-backoff'], self.cfg['restart-backoff'] * 2 ** (len(self.failures) - 1))
+        await self.instance.send_error(message + ' Restarting in {time:.0f}s.'.format(time=delay))
+        self.scheduler.call_later(delay, self.restart)
+
+    async def restart(self):
+        if not self.instance.running and not self.instance.pruning:
+            await self.instance.start_server()
+
+    def report(self):
+        """Describe recent incidents."""
+        if not self.incidents:
+            return 'No incidents.'
+        lines = []
+        for incident in self.incidents:
+            recover = 'not recovered' if incident['recover'] is None else \
+                'recovered in {recover:.1f}s'.format(**incident)
+            lines.append('{date}: {kind}, detected in {detect:.1f}s, {recover}'.format(
+                date=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(incident['time'])),
+                kind=incident['kind'], detect=incident['detect'], recover=recover))
+        return '\n'.join(lines)
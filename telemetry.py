@@ -0,0 +1,127 @@
+"""Sample the resource usage and tick lag of a server."""
+import array
+import os
+import time
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+LAG = r"Can't keep up!.*?Running ([0-9]+)ms"
+
+
+class Series:
+    """Fixed-size ring buffer of float values."""
+
+    def __init__(self, size):
+        self.data = array.array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.count % self.size] = value
+        self.count += 1
+
+    def values(self):
+        """Values, oldest first."""
+        if self.count <= self.size:
+            return self.data[:self.count].tolist()
+        start = self.count % self.size
+        return (self.data[start:] + self.data[:start]).tolist()
+
+    @property
+    def last(self):
+        return self.data[(self.count - 1) % self.size] if self.count else None
+
+    def percentile(self, p):
+        values = sorted(self.values())
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def read_proc(pid):
+    """Read CPU time (in seconds), RSS (in bytes), thread count and I/O (in bytes) of a process.
+
+    This blocks, run it in an executor."""
+    with open('/proc/{pid}/stat'.format(pid=pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()  # The process name may contain spaces
+    # Fields are numbered from the state, which is field 3 in proc(5)
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    threads = int(fields[17])
+    rss = int(fields[21]) * PAGE_SIZE
+    io = {}
+    try:
+        with open('/proc/{pid}/io'.format(pid=pid)) as f:
+            for line in f:
+                key, value = line.split(':')
+                io[key] = int(value)
+    except OSError:  # Not readable on every system
+        pass
+    return cpu, rss, threads, io.get('read_bytes', 0), io.get('write_bytes', 0)
+
+
+class Telemetry:
+    """Collect resource usage and tick lag of an instance in time series."""
+
+    METRICS = (('cpu', '%', 1), ('rss', 'MiB', 2 ** 20), ('threads', '', 1),
+               ('read', 'KiB/s', 2 ** 10), ('write', 'KiB/s', 2 ** 10), ('lag', 'ms', 1))
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.cfg = instance.cfg
+        self.series = {name: Series(self.cfg['telemetry-samples']) for name, unit, scale in self.METRICS}
+        self.previous = None
+        self.alerts = set()
+        instance.classifier.register(self.on_lag, "Can't keep up!", LAG, background=True)
+        if self.cfg['telemetry-interval'] > 0:
+            instance.client.scheduler.every(self.cfg['telemetry-interval'], self.sample)
+
+    async def sample(self):
+        proc = self.instance.proc
+        if not self.instance.running:
+            self.previous = None
+            return
+        try:
+            cpu, rss, threads, read, write = await self.instance.client.loop.run_in_executor(None, read_proc, proc.pid)
+        except (OSError, ValueError, IndexError):
+            return
+        now = time.monotonic()
+        if self.previous is not None and self.previous[0] == proc.pid:
+            pid, then, last_cpu, last_read, last_write = self.previous
+            elapsed = now - then
+            self.series['cpu'].append((cpu - last_cpu) / elapsed * 100)
+            self.series['read'].append((read - last_read) / elapsed)
+            self.series['write'].append((write - last_write) / elapsed)
+            await self.check('cpu', self.series['cpu'].last, self.cfg['alert-cpu'])
+        self.previous = (proc.pid, now, cpu, read, write)
+        self.series['rss'].append(rss)
+        self.series['threads'].append(threads)
+        await self.check('rss', rss / 2 ** 20, self.cfg['alert-rss'])
+
+    async def on_lag(self, line, match):
+        lag = int(match.group(1))
+        self.series['lag'].append(lag)
+        await self.check('lag', lag, self.cfg['alert-lag'])
+
+    async def check(self, name, value, threshold):
+        """Post an alert when a value goes over its threshold, once until it goes back under."""
+        if not threshold:
+            return
+        if value < threshold:
+            self.alerts.discard(name)
+        elif name not in self.alerts:
+            self.alerts.add(name)
+            unit = next(unit for metric, unit, scale in self.METRICS if metric == name)
+            await self.instance.send_error('High {name}: {value:.0f}{unit} (threshold: {threshold}{unit})'.format(
+                name=name, value=value, unit=unit, threshold=threshold))
+
+    def report(self):
+        """Describe recent values of each series."""
+        lines = ['{:8} {:>9} {:>9} {:>9} {:>9}'.format('', 'last', 'p50', 'p95', 'max')]
+        for name, unit, scale in self.METRICS:
+            series = self.series[name]
+            if not series.count:
+                continue
+            values = [series.last, series.percentile(50), series.percentile(95), series.percentile(100)]
+            lines.append('{:8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {}'.format(
+                name, *[value / scale for value in values], unit))
+        return '\n'.join(lines)
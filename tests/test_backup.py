@@ -0,0 +1,45 @@
+import os
+import backup
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    objects = str(tmp_path / 'objects')
+    write(str(tmp_path / 'a'), b'same' * 1000)
+    write(str(tmp_path / 'b'), b'same' * 1000)
+    digest, written = backup.store_file(str(tmp_path / 'a'), objects)
+    assert written > 0
+    assert backup.store_file(str(tmp_path / 'b'), objects) == (digest, 0)
+    assert os.listdir(os.path.join(objects, digest[:2])) == [digest]
+
+
+def test_scan_skips_excluded_directories(tmp_path):
+    write(str(tmp_path / 'world' / 'level.dat'), b'level')
+    write(str(tmp_path / 'backups' / 'objects' / 'x'), b'object')
+    files = backup.scan(str(tmp_path), [str(tmp_path / 'backups')])
+    assert list(files) == [os.path.join('world', 'level.dat')]
+    assert files[os.path.join('world', 'level.dat')][0] == 5
+
+
+def test_prune_and_restore(tmp_path):
+    store = backup.Store(str(tmp_path / 'backups'))
+    source = tmp_path / 'server'
+    manifests = []
+    for i, content in enumerate([b'old', b'new', b'new']):
+        write(str(source / 'file'), content)
+        digest, written = backup.store_file(str(source / 'file'), store.objects)
+        manifest = {'file': [digest, len(content), 1000000000 * (i + 1)]}
+        store.save('2024010{i}-000000'.format(i=i), manifest)
+        manifests.append(manifest)
+    assert store.list() == ['20240100-000000', '20240101-000000', '20240102-000000']
+    assert store.prune(2) == 1  # Only the first snapshot used the old content
+    assert store.list() == ['20240101-000000', '20240102-000000']
+    store.restore('20240102-000000', str(tmp_path / 'restored'))
+    with open(str(tmp_path / 'restored' / 'file'), 'rb') as f:
+        assert f.read() == b'new'
+    assert os.stat(str(tmp_path / 'restored' / 'file')).st_mtime_ns == 3000000000
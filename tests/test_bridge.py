@@ -0,0 +1,75 @@
+import json
+import bridge
+
+
+class Metrics:
+    def inc(self, name, **labels):
+        pass
+
+
+class Loop:
+    def create_task(self, coro):
+        coro.close()  # Batches are taken by hand
+
+
+class Client:
+    loop = Loop()
+    metrics = Metrics()
+
+
+class Instance:
+    client = Client()
+    cfg = {'channel': '1'}
+
+    def __init__(self):
+        self.commands = []
+
+    def console(self, message):
+        self.commands.append(message)
+
+
+def make_bridge(rate=60, burst=5, batch=3):
+    return bridge.Bridge(Instance(), 1, rate, burst, batch)
+
+
+def test_escape():
+    assert bridge.escape('a\nb\x00c\x1b§4red') == 'a bc4red'
+    assert len(bridge.escape('x' * 1000)) == bridge.MAX_LENGTH
+
+
+def test_batches_take_one_message_per_user_in_turn():
+    b = make_bridge()
+    for i in range(5):
+        b.push('busy', 'Busy', 'spam {i}'.format(i=i))
+    b.push('a', 'Alice', 'hello')
+    b.push('b', 'Bob', 'hi')
+    assert b.next_batch() == [('Busy', 'spam 0'), ('Alice', 'hello'), ('Bob', 'hi')]
+    assert b.next_batch() == [('Busy', 'spam 1'), ('Busy', 'spam 2'), ('Busy', 'spam 3')]
+    assert b.queued == 1
+
+
+def test_full_queues_drop_messages():
+    b = make_bridge(burst=2)
+    assert b.push('a', 'Alice', '1') and b.push('a', 'Alice', '2')
+    assert not b.push('a', 'Alice', '3')
+    assert b.dropped == 1
+
+
+def test_users_over_their_rate_wait():
+    b = make_bridge(rate=0, burst=2, batch=10)
+    for i in range(2):
+        b.push('a', 'Alice', str(i))
+    assert len(b.next_batch()) == 2  # The burst
+    b.push('a', 'Alice', 'late')
+    assert b.next_batch() == []
+    assert b.queued == 1
+
+
+def test_send_builds_one_tellraw():
+    b = make_bridge()
+    b.send([('Alice', 'hello'), ('Bob', '"quoted"')])
+    command, = b.instance.commands
+    assert command.startswith('tellraw @a ')
+    components = json.loads(command[len('tellraw @a '):])
+    assert components == ['', {'text': '<Alice> ', 'color': 'aqua'}, 'hello', '\n',
+                          {'text': '<Bob> ', 'color': 'aqua'}, '"quoted"']
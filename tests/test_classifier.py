@@ -0,0 +1,100 @@
+import asyncio
+import classifier
+from classifier import Line
+
+
+def info(text):
+    return Line(0, 'Server thread/INFO', text)
+
+
+def test_failing_handlers_do_not_stop_dispatch():
+    calls = []
+
+    async def failing(line, match):
+        raise RuntimeError('Discord is down')
+
+    async def handler(line, match):
+        calls.append(line.text)
+
+    c = classifier.Classifier()
+    c.register(failing, 'Done')
+    c.register(handler, 'Done')
+    asyncio.run(c.dispatch(info('Done (1.0s)!')))
+    assert calls == ['Done (1.0s)!']
+
+
+def test_background_handlers_do_not_hold_dispatch():
+    async def main():
+        calls = []
+        release = asyncio.Event()
+
+        async def slow(line, match):
+            await release.wait()
+            calls.append('slow')
+
+        async def handler(line, match):
+            calls.append('inline')
+
+        c = classifier.Classifier()
+        c.register(slow, '', background=True)
+        c.register(handler, '')
+        await asyncio.wait_for(c.dispatch(info('line')), 1)
+        assert calls == ['inline'] and len(c.tasks) == 1
+        release.set()
+        await asyncio.sleep(0.01)
+        assert calls == ['inline', 'slow'] and not c.tasks
+    asyncio.run(main())
+
+
+
+def recorder(calls, name):
+    async def on_line(line, match):
+        calls.append((name, line.text, match.groups() if match else None))
+    return on_line
+
+
+def test_prefix_dispatch():
+    c = classifier.Classifier()
+    calls = []
+    c.register(recorder(calls, 'done'), 'Done (')
+    c.register(recorder(calls, 'chat'), '<')
+    c.register(recorder(calls, 'all'))
+    for text in ['Done (3.2s)!', '<Steve> hi', 'Steve joined the game']:
+        asyncio.run(c.dispatch(info(text)))
+    assert calls == [('all', 'Done (3.2s)!', None), ('done', 'Done (3.2s)!', None),
+                     ('all', '<Steve> hi', None), ('chat', '<Steve> hi', None),
+                     ('all', 'Steve joined the game', None)]
+
+
+def test_logger_filter_and_pattern():
+    c = classifier.Classifier()
+    calls = []
+    c.register(recorder(calls, 'chat'), '<', r'<([^\s<>]*)> (.*)', logger='Server thread/INFO')
+    asyncio.run(c.dispatch(info('<Steve> hello')))
+    asyncio.run(c.dispatch(Line(0, 'Worker-Main-3/WARN', '<Steve> hello')))
+    asyncio.run(c.dispatch(info('<not chat')))
+    assert calls == [('chat', '<Steve> hello', ('Steve', 'hello'))]
+
+
+def test_register_during_dispatch():
+    c = classifier.Classifier()
+    calls = []
+
+    async def registering(line, match):
+        calls.append(('registering', line.text, None))
+        if len(calls) == 1:  # A shorter prefix, sorted before the one being dispatched
+            c.register(recorder(calls, 'late'), 'Do')
+    c.register(registering, 'Done')
+    c.register(recorder(calls, 'long'), 'Done (')
+    asyncio.run(c.dispatch(info('Done (3.2s)!')))
+    assert [name for name, text, match in calls] == ['registering', 'long']
+    asyncio.run(c.dispatch(info('Done (3.2s)!')))
+    assert [name for name, text, match in calls] == ['registering', 'long', 'late', 'registering', 'long']
+    c.unregister(registering)
+    assert c.lengths == [2, 6]
+
+
+def test_parse():
+    line = classifier.parse('[12:34:56] [Server thread/INFO]: Steve joined the game')
+    assert (line.logger, line.text) == ('Server thread/INFO', 'Steve joined the game')
+    assert classifier.parse('\tat java.lang.Thread.run') is None
@@ -0,0 +1,98 @@
+import asyncio
+import console
+import control
+from classifier import Line
+
+
+class Stream:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class Instance:
+    running = True
+
+    def __init__(self):
+        self.proc = self
+        self.stdin = Stream()
+        self.handlers = []
+
+    def register(self, func, *args):
+        self.handlers.append(func)
+
+    @property
+    def classifier(self):
+        return self
+
+
+def info(text):
+    return Line(0, 'Server thread/INFO', text)
+
+
+def capture(commands, lines):
+    async def main():
+        instance = Instance()
+        stdin = console.Stdin(instance, 0.05)
+        request = asyncio.ensure_future(stdin.request(*commands))
+        await asyncio.sleep(0)
+        for line in lines:
+            await stdin.on_line(line, None)
+        return await request, instance.stdin.written
+    return asyncio.run(main())
+
+
+def test_response_pattern():
+    assert console.response_pattern(frozenset(['list', 'say'])).match('There are 2 of a max of 20 players online')
+    assert not console.response_pattern(frozenset(['say'])).match('Steve was slain by Zombie')
+    assert console.response_pattern(frozenset(['say', 'unknown'])) is None
+    assert console.command_name('/minecraft:give Steve stone') == 'give'
+
+
+def test_capture_keeps_command_output():
+    response, written = capture(['say hello', 'give Steve stone'], [
+        info('Steve was slain by Zombie'),
+        info('Steve has made the advancement [Stone Age]'),
+        info('[Server] hello'),
+        Line(0, 'Worker-Main-3/WARN', 'Gave nothing'),
+        info('Gave 1 [Stone] to Steve'),
+    ])
+    assert written == [b'say hello\ngive Steve stone\n']
+    assert response.text == '[Server] hello\nGave 1 [Stone] to Steve'
+    assert response.latency is not None
+
+
+def test_capture_of_unknown_commands_skips_noise():
+    response, written = capture(['frobnicate'], [info('<Steve> hi'), info('Frobnicated')])
+    assert response.text == 'Frobnicated'
+
+
+def test_capture_without_output():
+    response, written = capture(['tellraw @a "hi"'], [info('Steve was slain by Zombie')])
+    assert response.text == ''
+    assert response.latency is None
+
+
+def test_control_requests_get_their_own_capture():
+    async def from_socket(stdin):
+        control.REPLIES[control.current_task()] = []
+        try:
+            return await stdin.request('list')
+        finally:
+            control.REPLIES.pop(control.current_task())
+
+    async def main():
+        stdin = console.Stdin(Instance(), 0.05)
+        socket = asyncio.ensure_future(from_socket(stdin))
+        await asyncio.sleep(0)
+        discord = asyncio.ensure_future(stdin.request('say hello'))
+        await asyncio.sleep(0)
+        assert len(stdin.captures) == 2
+        await stdin.on_line(info('There are 0 of a max of 20 players online: '), None)
+        await stdin.on_line(info('[Server] hello'), None)
+        return await socket, await discord
+    socket, discord = asyncio.run(main())
+    assert socket.text == 'There are 0 of a max of 20 players online: '
+    assert discord.text == '[Server] hello'
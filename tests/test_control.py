@@ -0,0 +1,45 @@
+import asyncio
+import json
+import os
+import control
+
+
+class Perms:
+    def get_role(self, name):
+        return {'admin': {'list'}}.get(name, set())
+
+
+class Client:
+    def __init__(self, path, users):
+        self.cfg = {'control-socket': path, 'control-users': users}
+        self.perms = Perms()
+        self.servers = {}
+        self.loop = asyncio.get_event_loop()
+
+
+def request(path, users, *requests):
+    async def main():
+        server = control.Control(Client(path, users))
+        await server.start()
+        reader, writer = await asyncio.open_unix_connection(path)
+        responses = []
+        for obj in requests:
+            writer.write(json.dumps(obj).encode() + b'\n')
+            responses.append(json.loads(await reader.readline()))
+        writer.close()
+        return responses, server
+    return asyncio.run(main())
+
+
+def test_uids_without_role_cannot_subscribe(tmp_path):
+    path = str(tmp_path / 'control.sock')
+    (response,), server = request(path, {}, {'id': 1, 'subscribe': True})
+    assert response == {'id': 1, 'ok': False, 'error': 'No role is assigned to this uid'}
+    assert not server.subscribers
+
+
+def test_subscribe(tmp_path):
+    path = str(tmp_path / 'control.sock')
+    responses, server = request(path, {str(os.getuid()): 'admin'}, {'id': 1, 'subscribe': True},
+                                {'id': 2, 'subscribe': False})
+    assert responses == [{'id': 1, 'subscribed': True, 'ok': True}, {'id': 2, 'subscribed': False, 'ok': True}]
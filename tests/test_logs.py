@@ -0,0 +1,22 @@
+import logs
+from classifier import Line
+
+
+def test_query_keeps_the_last_lines(tmp_path):
+    archive = logs.Archive(str(tmp_path), 1 << 20, 3)
+    archive.write([Line(1000 + i, 'Server thread/INFO', 'line {i}'.format(i=i)) for i in range(100)])
+    lines = archive.query(1000, 1100, limit=10)
+    assert [line.text for line in lines] == ['line {i}'.format(i=i) for i in range(90, 100)]
+    assert [line.text for line in archive.query(1000, 1100, 'line 4[0-9]')][0] == 'line 40'
+
+
+def test_segments_are_kept_while_read(tmp_path):
+    archive = logs.Archive(str(tmp_path), 1, 1)
+    archive.write([Line(1000, 'Server thread/INFO', 'first')])
+    archive.readers += 1  # A query is reading
+    archive.write([Line(2000, 'Server thread/INFO', 'second')])
+    assert len(archive.index) == 1
+    assert len(list(tmp_path.glob('segment-*'))) == 2
+    archive.readers -= 1
+    archive.query(0, 3000)
+    assert len(list(tmp_path.glob('segment-*'))) == 1
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import pytest
+import control
+import permissions
+
+
+class Client:
+    cfg = {'role-watch-interval': 0, 'role-save-delay': 0}
+
+
+def make(tmp_path, roles, users=None):
+    roles_file, users_file = tmp_path / 'roles.json', tmp_path / 'users.json'
+    roles_file.write_text(json.dumps(roles))
+    users_file.write_text(json.dumps(users or {}))
+    return permissions.Permissions(str(roles_file), str(users_file), Client())
+
+
+def test_sub_roles_are_flattened(tmp_path):
+    perms = make(tmp_path, {'admin': ['stop', '#mod'], 'mod': ['start', '#user'], 'user': ['tail']},
+                 {'1': 'admin', '2': 'user'})
+    assert perms.roles['admin'].effective == {'stop', 'start', 'tail', '#admin', '#mod', '#user'}
+    assert 'tail' in perms['2'] and 'start' not in perms['2']
+    assert 'start' in perms['1']
+
+
+def test_unknown_user_has_no_permissions(tmp_path):
+    perms = make(tmp_path, {'user': ['tail']})
+    assert not perms['3']
+    assert 'tail' not in perms['3']
+
+
+def test_wildcard_excludes_listed_permissions(tmp_path):
+    perms = make(tmp_path, {'admin': ['@'], 'user': ['tail', '$chat']}, {'1': 'admin'})
+    role = perms['1']
+    assert 'give' in role
+    assert 'tail' not in role  # Listed permissions must be granted explicitly
+    assert '$chat' not in role and '#user' not in role
+
+
+def test_cycles_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Cyclic'):
+        make(tmp_path, {'a': ['#b'], 'b': ['#c'], 'c': ['#a']})
+
+
+def test_reload_keeps_unchanged_roles(tmp_path):
+    perms = make(tmp_path, {'admin': ['#mod'], 'mod': ['start'], 'other': ['x']}, {'1': 'admin'})
+    other, admin = perms.roles['other'], perms.roles['admin']
+    perms.load_roles({'admin': ['#mod'], 'mod': ['start', 'stop'], 'other': ['x']})
+    assert perms.roles['other'] is other
+    assert perms.roles['admin'] is not admin
+    assert 'stop' in perms['1']
+
+
+def test_failed_reload_keeps_previous_roles(tmp_path):
+    perms = make(tmp_path, {'user': ['tail']}, {'1': 'user'})
+    with pytest.raises(ValueError):
+        perms.load_roles({'a': ['#b'], 'b': ['#a']})
+    assert 'tail' in perms['1']
+
+
+class Scheduler:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, func, *args):
+        self.timers.append(func)
+        return func
+
+    def cancel(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+
+class Instance:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def send_error_perms(self, message):
+        self.sent.append(message)
+
+
+def test_set_role_from_the_control_socket(tmp_path):
+    perms = make(tmp_path, {'admin': ['#user'], 'user': ['tail']})
+    perms.client.scheduler = Scheduler()
+    instance = Instance()
+    asyncio.run(perms.set_role('123456789012345678 #user', control.Caller(1000, 'admin'), instance))
+    assert 'tail' in perms['123456789012345678']
+    asyncio.run(perms.set_role('123456789012345678 #admin', control.Caller(1001, None), instance))
+    assert perms.users['123456789012345678'] == 'user'
+    assert instance.sent == ['Role #**user** successfully assigned.', "uid 1001, you don't have a role."]
+
+
+async def in_loop(perms, func):
+    perms.client.loop = asyncio.get_event_loop()
+    await func()
+
+
+def test_flush_saves_pending_changes(tmp_path):
+    perms = make(tmp_path, {'admin': ['#user'], 'user': ['tail']}, {'1': 'admin'})
+    perms.client.scheduler = Scheduler()
+    asyncio.run(perms.set_role('123456789012345678 #user', control.Caller(1000, 'admin'), Instance()))
+    assert perms.client.scheduler.timers == [perms.save]
+    asyncio.run(in_loop(perms, perms.flush))
+    assert not perms.client.scheduler.timers and not perms.dirty
+    assert json.loads((tmp_path / 'users.json').read_text())['123456789012345678'] == 'user'
+
+
+def test_failed_save_is_retried(tmp_path):
+    perms = make(tmp_path, {'user': ['tail']})
+    perms.client.scheduler = Scheduler()
+    perms.users_filename = str(tmp_path / 'missing' / 'users.json')
+    perms.dirty = {'1': 'user'}
+    asyncio.run(in_loop(perms, perms.save))
+    assert perms.dirty == {'1': 'user'}
+    assert perms.client.scheduler.timers == [perms.save]
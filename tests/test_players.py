@@ -0,0 +1,31 @@
+import asyncio
+import sqlite3
+import classifier
+import players
+
+
+class Client:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+
+
+class Instance:
+    def __init__(self):
+        self.client = Client()
+        self.classifier = classifier.Classifier()
+
+
+def test_close_writes_pending_sessions(tmp_path):
+    path = str(tmp_path / 'players.db')
+
+    async def main():
+        tracker = players.Players(Instance(), path, 60)
+        for text in ('Steve joined the game', 'Alex joined the game', 'Steve was slain by Zombie'):
+            await tracker.instance.classifier.dispatch(classifier.Line(0, 'Server thread/INFO', text))
+        await tracker.close()
+        tracker.leave_all()  # Once closed, nothing is written anymore
+        await asyncio.sleep(0)
+    asyncio.run(main())
+    db = sqlite3.connect(path)
+    assert sorted(row[0] for row in db.execute('SELECT name FROM sessions')) == ['Alex', 'Steve']
+    assert dict(db.execute('SELECT name, deaths FROM players')) == {'Alex': 0, 'Steve': 1}
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+import pytest
+import rcon
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+import fake_rcon  # noqa: E402
+
+
+def run(test):
+    async def main():
+        server = fake_rcon.FakeRcon()
+        await server.start()
+        client = rcon.Rcon('127.0.0.1', server.port, 'secret', asyncio.get_event_loop(), timeout=2)
+        try:
+            await test(server, client)
+        finally:
+            client.close()
+            await server.stop()
+    asyncio.run(main())
+
+
+def test_pipelined_commands_get_their_own_response():
+    async def test(server, client):
+        texts = await asyncio.gather(*[client.command('echo {i}'.format(i=i)) for i in range(50)])
+        assert texts == [str(i) for i in range(50)]
+        assert server.connections == 1
+    run(test)
+
+
+@pytest.mark.parametrize('size', [0, 100, 4095, 4096, 4097, 8192, 20000])
+def test_split_responses_are_joined(size):
+    async def test(server, client):
+        response, after = await asyncio.gather(client.command('big {size}'.format(size=size)), client.command('echo after'))
+        assert response == 'x' * size
+        assert after == 'after'
+    run(test)
+
+
+def test_request_joins_responses():
+    async def test(server, client):
+        response = await client.request('echo a', 'big 0', 'echo b')
+        assert response.commands == ['echo a', 'big 0', 'echo b']
+        assert response.text == 'a\nb'
+    run(test)
+
+
+def test_reconnects_after_the_connection_is_lost():
+    async def test(server, client):
+        assert await client.command('echo first') == 'first'
+        pending = asyncio.ensure_future(client.command('sleep 0.2'))
+        with pytest.raises(rcon.RconError):
+            await client.command('drop')
+        with pytest.raises(rcon.RconError):
+            await pending
+        assert await client.command('echo second') == 'second'
+        assert server.connections == 2
+    run(test)
+
+
+def test_wrong_password():
+    async def test(server, client):
+        client.password = 'wrong'
+        with pytest.raises(rcon.RconError, match='authentication'):
+            await client.command('echo hello')
+    run(test)
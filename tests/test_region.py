@@ -0,0 +1,56 @@
+import mmap
+import zlib
+import region
+
+
+def chunk(ticks, kind=2, padding=0):
+    """A chunk in sectors: length, compression type and compressed NBT holding InhabitedTime."""
+    nbt = b'\x0a\x00\x00' + region.INHABITED + ticks.to_bytes(8, 'big', signed=True) + b'\x00' * padding + b'\x00'
+    data = zlib.compress(nbt) if kind == 2 else nbt
+    raw = (len(data) + 1).to_bytes(4, 'big') + bytes([kind]) + data
+    return raw + b'\x00' * (-len(raw) % region.SECTOR)
+
+
+def make_region(path, chunks):
+    """Write a region file from {index: chunk data}."""
+    header = bytearray(region.HEADER)
+    body = b''
+    offset = 2
+    for index, data in sorted(chunks.items()):
+        sectors = len(data) // region.SECTOR
+        header[index * 4:index * 4 + 4] = ((offset << 8) | sectors).to_bytes(4, 'big')
+        header[region.SECTOR + index * 4:region.SECTOR + index * 4 + 4] = (1700000000 + index).to_bytes(4, 'big')
+        body += data
+        offset += sectors
+    with open(path, 'wb') as f:
+        f.write(bytes(header) + body)
+
+
+def test_header_and_inhabited_time(tmp_path):
+    path = str(tmp_path / 'r.0.0.mca')
+    make_region(path, {0: chunk(5), 7: chunk(123456, kind=3), 1023: chunk(-1, padding=10000)})
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        found = list(region.locations(mm))
+        assert [(index, sectors) for index, offset, sectors in found] == [(0, 1), (7, 1), (1023, 1)]
+        assert [region.inhabited_time(mm, offset) for index, offset, sectors in found] == [5, 123456, -1]
+
+
+def test_analyze_and_prune(tmp_path):
+    path = str(tmp_path / 'r.0.0.mca')
+    make_region(path, {0: chunk(10), 1: chunk(5000), 2: chunk(20), 3: chunk(9000)})
+    assert region.analyze_file(path, 1000)[:2] == (4, 2)
+    removed, freed = region.prune_file(path, 1000)
+    assert (removed, freed) == (2, 2 * region.SECTOR)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        kept = list(region.locations(mm))
+        assert [(index, offset) for index, offset, sectors in kept] == [(1, 2), (3, 3)]
+        assert [region.inhabited_time(mm, offset) for index, offset, sectors in kept] == [5000, 9000]
+        assert int.from_bytes(mm[region.SECTOR + 4:region.SECTOR + 8], 'big') == 1700000001  # Timestamps kept
+    assert region.prune_file(path, 1000) == (0, 0)
+
+
+def test_prune_removes_empty_files(tmp_path):
+    path = tmp_path / 'r.0.0.mca'
+    make_region(str(path), {0: chunk(10)})
+    assert region.prune_file(str(path), 1000)[0] == 1
+    assert not path.exists()
@@ -0,0 +1,88 @@
+import scheduler
+
+
+class Handle:
+    def __init__(self, when):
+        self.when = when
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Loop:
+    """Event loop with a clock moved by hand."""
+
+    def __init__(self):
+        self.now = 0
+        self.handles = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, func):
+        handle = Handle(when)
+        self.handles.append(handle)
+        return handle
+
+    def advance(self, now, sched):
+        self.now = now
+        armed = [handle for handle in self.handles if not handle.cancelled]
+        assert len(armed) <= 1  # A single callback is armed
+        if armed and armed[0].when <= now:
+            armed[0].cancelled = True
+            sched.fire()
+
+
+def test_timers_fire_in_order():
+    loop = Loop()
+    sched = scheduler.Scheduler(loop)
+    calls = []
+    sched.call_later(3, calls.append, 'c')
+    sched.call_later(1, calls.append, 'a')
+    sched.call_later(2, calls.append, 'b')
+    assert len(sched) == 3
+    loop.advance(1.5, sched)
+    assert calls == ['a']
+    loop.advance(5, sched)
+    assert calls == ['a', 'b', 'c']
+    assert len(sched) == 0
+
+
+def test_every_repeats():
+    loop = Loop()
+    sched = scheduler.Scheduler(loop)
+    calls = []
+    timer = sched.every(10, calls.append, 'tick', delay=1)
+    for now in (1, 11, 21):
+        loop.advance(now, sched)
+    assert calls == ['tick'] * 3
+    sched.cancel(timer)
+    loop.advance(31, sched)
+    assert calls == ['tick'] * 3
+
+
+def test_cancel():
+    loop = Loop()
+    sched = scheduler.Scheduler(loop)
+    calls = []
+    timers = [sched.call_later(i + 1, calls.append, i) for i in range(10)]
+    for timer in timers[:8]:
+        sched.cancel(timer)
+    sched.cancel(timers[0])  # Cancelling twice does nothing
+    assert len(sched) == 2
+    assert len(sched.heap) < 10  # Rebuilt once most timers were cancelled
+    loop.advance(100, sched)
+    assert calls == [8, 9]
+    sched.cancel(timers[9])  # Already ran
+    assert len(sched) == 0
+
+
+def test_failing_callback_does_not_stop_others():
+    loop = Loop()
+    sched = scheduler.Scheduler(loop)
+    calls = []
+    sched.call_later(1, lambda: 1 / 0)
+    sched.call_later(1, calls.append, 'after')
+    loop.advance(1, sched)
+    assert calls == ['after']
@@ -0,0 +1,32 @@
+import asyncio
+import sender
+
+
+def test_coalescer_flushes_full_batches_without_waiting():
+    async def main():
+        flushed = []
+
+        async def flush(lines):
+            flushed.append(lines)
+        buffer = sender.Coalescer(flush, 60, 10, asyncio.get_event_loop(), batch=4)
+        assert not any(buffer.push(i) for i in range(9))
+        await asyncio.sleep(0.01)
+        assert flushed == [list(range(9))]
+        assert buffer.dropped == 0
+        buffer.push(9)
+        buffer.task.cancel()
+    asyncio.run(main())
+
+
+def test_coalescer_drops_the_oldest_lines():
+    async def main():
+        flushed = []
+
+        async def flush(lines):
+            flushed.append(lines)
+        buffer = sender.Coalescer(flush, 0.01, 3, asyncio.get_event_loop())
+        assert [buffer.push(i) for i in range(5)] == [False, False, False, True, True]
+        await asyncio.sleep(0.05)
+        assert flushed == [[2, 3, 4]]
+        assert buffer.dropped == 2
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import asyncio
+import classifier
+import supervisor
+from classifier import Line
+
+
+class Scheduler:
+    def __init__(self):
+        self.calls = []
+
+    def call_later(self, delay, func, *args):
+        self.calls.append(func)
+
+    def cancel(self, timer):
+        pass
+
+
+class Client:
+    def __init__(self):
+        self.scheduler = Scheduler()
+        self.loop = asyncio.get_event_loop()
+
+
+class Process:
+    def __init__(self, code):
+        self.code = code
+        self.exited = asyncio.Event()
+
+    async def wait(self):
+        await self.exited.wait()
+        return self.code
+
+
+class Instance:
+    def __init__(self):
+        self.cfg = {'watchdog-interval': 0, 'crash-loop-window': 600, 'crash-loop-count': 3, 'restart-backoff': 5,
+                    'restart-max-backoff': 60}
+        self.client = Client()
+        self.classifier = classifier.Classifier()
+        self.proc = None
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def send_error(self, message):
+        self.sent.append(message)
+
+    async def set_trigger(self, tag, message):
+        pass
+
+
+def exit_with(code, lines=()):
+    async def main():
+        instance = Instance()
+        watcher = supervisor.Supervisor(instance)
+        instance.proc = Process(code)
+        watcher.started(instance.proc)
+        for text in lines:
+            await instance.classifier.dispatch(Line(0, 'Server thread/INFO', text))
+        instance.proc.exited.set()
+        await asyncio.sleep(0.01)
+        return instance, watcher
+    return asyncio.run(main())
+
+
+def test_crash_is_restarted():
+    instance, watcher = exit_with(1)
+    assert instance.client.scheduler.calls == [watcher.restart]
+    assert instance.sent == ['Server exited unexpectedly (code 1). Restarting in 5s.']
+
+
+def test_clean_exit_is_not_restarted():
+    instance, watcher = exit_with(0)
+    assert not instance.client.scheduler.calls
+    assert not watcher.incidents
+
+
+def test_stop_command_is_not_restarted():
+    for line in ('Stopping the server', '[Steve: Stopping the server]', '[Rcon: Stopping the server]'):
+        instance, watcher = exit_with(130, ['Saving chunks', line])
+        assert not instance.client.scheduler.calls
+        assert instance.sent == ['Server stopped outside of minecord (code 130).']
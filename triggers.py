@@ -0,0 +1,83 @@
+"""Messages with reactions added by the client, used as buttons."""
+import json
+import discord
+import storage
+
+
+def load_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+class Triggers:
+    """Trigger messages of an instance, by tag and by message id.
+
+    Messages are kept while they hold a trigger, so moving a trigger doesn't
+    fetch the previous message again. The registry is saved to a file so that
+    buttons keep working after minecord restarts."""
+
+    def __init__(self, instance, path):
+        self.instance = instance
+        self.path = path
+        self.tags = {}
+        self.by_message = {}
+        self.messages = {}
+        self.save_timer = None
+
+    def __contains__(self, tag):
+        return tag in self.tags
+
+    def tags_of(self, message_id):
+        """Tags of a message, empty if it isn't a trigger."""
+        return self.by_message.get(message_id, ())
+
+    def add(self, tag, message: discord.Message):
+        self.tags[tag] = message.id
+        self.by_message.setdefault(message.id, set()).add(tag)
+        self.messages[message.id] = message
+        self.changed()
+
+    def pop(self, tag):
+        """Remove a trigger, return its message if it is known."""
+        message_id = self.tags.pop(tag)
+        message = self.messages.get(message_id)
+        tags = self.by_message[message_id]
+        tags.discard(tag)
+        if not tags:
+            self.by_message.pop(message_id)
+            self.messages.pop(message_id, None)
+        self.changed()
+        return message_id, message
+
+    def changed(self):
+        if self.save_timer is None:
+            self.save_timer = self.instance.client.scheduler.call_later(1, self.save)
+
+    async def save(self):
+        self.save_timer = None
+        data = {'channel': self.instance.cfg['channel'], 'triggers': dict(self.tags)}
+        try:
+            await self.instance.client.loop.run_in_executor(None, storage.write_json, self.path, data)
+        except OSError as e:
+            print('Triggers were not saved: {error}'.format(error=e))
+
+    async def load(self):
+        """Adopt the trigger messages saved by a previous run, if they still exist."""
+        client = self.instance.client
+        data = await client.loop.run_in_executor(None, load_file, self.path)
+        if data.get('channel') != self.instance.cfg['channel']:
+            return
+        fetched = {}
+        for tag, message_id in data.get('triggers', {}).items():
+            if message_id not in fetched:
+                try:
+                    fetched[message_id] = await client.get_message(self.instance.channel, message_id)
+                except discord.NotFound:
+                    fetched[message_id] = None
+                else:  # Reactions are only dispatched for messages in the client's cache
+                    client.connection.messages.append(fetched[message_id])
+            if fetched[message_id] is not None:
+                self.add(tag, fetched[message_id])